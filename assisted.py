@@ -0,0 +1,129 @@
+import argparse
+import os
+import time
+import backends
+
+# Draft models must share the main model's tokenizer; flan-t5-small does for the whole family.
+DEFAULT_DRAFT_MODEL = "google/flan-t5-small"
+# Empty: assisted decoding off. Exported through the environment so spawned workers follow.
+DRAFT_MODEL = os.environ.get("LLM_ASSIST_MODEL", "")
+LOOKAHEAD = int(os.environ.get("LLM_ASSIST_LOOKAHEAD", 5))
+
+_stats = {}
+
+def configure(draft_model, lookahead=LOOKAHEAD):
+    global DRAFT_MODEL, LOOKAHEAD
+    if draft_model and backends.BACKEND == "onnx":
+        raise ValueError("Assisted decoding needs a PyTorch backend (eager, int8 or bf16), not onnx")
+    DRAFT_MODEL = draft_model or ""
+    LOOKAHEAD = lookahead
+    os.environ["LLM_ASSIST_MODEL"] = DRAFT_MODEL
+    os.environ["LLM_ASSIST_LOOKAHEAD"] = str(LOOKAHEAD)
+    if DRAFT_MODEL:
+        print(f"Assisted decoding: draft {DRAFT_MODEL}, lookahead {LOOKAHEAD}")
+
+def enabled():
+    return bool(DRAFT_MODEL) and backends.BACKEND != "stub"
+
+def get_draft_model():
+    from model_registry import get_registry
+    backend = backends.BACKEND
+    model = get_registry().get((DRAFT_MODEL, backend), lambda: backends.load_model(DRAFT_MODEL, backend))
+    # A constant schedule keeps the lookahead at what was asked for.
+    model.generation_config.num_assistant_tokens = LOOKAHEAD
+    model.generation_config.num_assistant_tokens_schedule = "constant"
+    return model
+
+def generate(model, input_ids, **kwargs):
+    # One sequence per call: transformers' assisted generation does not batch.
+    draft = get_draft_model()
+    calls = {"target": 0, "draft": 0}
+
+    def counter(name):
+        def hook(*_):
+            calls[name] += 1
+        return hook
+
+    hooks = [model.register_forward_hook(counter("target")), draft.register_forward_hook(counter("draft"))]
+    start = time.perf_counter()
+    try:
+        output = model.generate(input_ids=input_ids, assistant_model=draft, **kwargs)
+    finally:
+        for h in hooks:
+            h.remove()
+    # Every verification step keeps the accepted draft tokens plus one token of the main model's own.
+    new_tokens = output.shape[1] - 1
+    stats = _stats.setdefault(model.name_or_path, {"sequences": 0, "tokens": 0, "target_steps": 0,
+                                                   "draft_tokens": 0, "seconds": 0.0})
+    stats["sequences"] += 1
+    stats["tokens"] += new_tokens
+    stats["target_steps"] += calls["target"]
+    stats["draft_tokens"] += calls["draft"]
+    stats["seconds"] += time.perf_counter() - start
+    return output
+
+def acceptance(stats):
+    accepted = max(0, stats["tokens"] - stats["target_steps"])
+    return accepted / stats["draft_tokens"] if stats["draft_tokens"] else 0.0
+
+def report():
+    for model_name, s in _stats.items():
+        print(f"[assisted] {model_name} with {DRAFT_MODEL} (lookahead {LOOKAHEAD}): {s['sequences']} sequences, "
+              f"acceptance {acceptance(s):.1%}, {s['tokens'] / max(1, s['target_steps']):.2f} tokens per main-model "
+              f"step, {s['tokens'] / max(s['seconds'], 1e-9):.1f} tokens/s")
+    _stats.clear()
+
+def _compare(model, tokenizer, encoded, kwargs):
+    # Plain and assisted greedy decoding, one sequence at a time for both.
+    import torch
+    plain, fast = [], []
+    start = time.perf_counter()
+    with torch.inference_mode(), backends.generation_context():
+        for ids in encoded:
+            plain.append(model.generate(input_ids=torch.tensor([ids]), **kwargs)[0])
+        plain_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for ids in encoded:
+            fast.append(generate(model, torch.tensor([ids]), **kwargs)[0])
+        fast_s = time.perf_counter() - start
+    plain = tokenizer.batch_decode(plain, skip_special_tokens=True)
+    fast = tokenizer.batch_decode(fast, skip_special_tokens=True)
+    return plain, fast, plain_s, fast_s
+
+if __name__ == "__main__":
+    import json
+    parser = argparse.ArgumentParser(description="Check assisted decoding against plain greedy decoding")
+    parser.add_argument("--target", choices=["summary", "mutation"], default="summary")
+    parser.add_argument("--draft", default=DEFAULT_DRAFT_MODEL)
+    parser.add_argument("--lookahead", type=int, default=LOOKAHEAD)
+    parser.add_argument("--articles", type=int, default=8, help="inputs to decode")
+    args = parser.parse_args()
+    configure(args.draft, args.lookahead)
+
+    if args.target == "summary":
+        import llm_utils
+        from corpus import get_corpus
+        articles = [item["article"] for item in get_corpus().head("cnn", args.articles)]
+        with open("data/initial_prompts.json", "r", encoding="utf-8") as f:
+            prompt = json.load(f)[0]["text"]
+        encoded = llm_utils.encode_pairs([(prompt, a) for a in articles])
+        model, tokenizer = llm_utils.get_model(), llm_utils.get_tokenizer()
+        kwargs = {"max_length": 128, "min_length": 30, "num_beams": 1}
+    else:
+        import generate_prompts
+        from mutations import MUTATION_GUIDELINES
+        with open("data/initial_prompts.json", "r", encoding="utf-8") as f:
+            prompts = [p["text"] for p in json.load(f)]
+        requests = [(p, g) for p in prompts for g in MUTATION_GUIDELINES.values()][:args.articles]
+        tokenizer, model = generate_prompts.get_tokenizer(), generate_prompts.get_model()
+        texts = [generate_prompts.build_rewrite_input(p, g) for p, g in requests]
+        encoded = tokenizer(texts, truncation=True, max_length=generate_prompts.GENERATION_PARAMS["max_input_length"])["input_ids"]
+        kwargs = {"max_length": generate_prompts.GENERATION_PARAMS["max_length"], "do_sample": False,
+                  "repetition_penalty": generate_prompts.GENERATION_PARAMS["repetition_penalty"]}
+
+    plain, fast, plain_s, fast_s = _compare(model, tokenizer, encoded, kwargs)
+    mismatches = sum(a != b for a, b in zip(plain, fast))
+    report()
+    print(f"[assisted] {len(encoded)} inputs: plain greedy {plain_s:.1f}s, assisted {fast_s:.1f}s, "
+          f"speedup {plain_s / max(fast_s, 1e-9):.2f}x, {mismatches} outputs differ from plain greedy")
+    raise SystemExit(1 if mismatches else 0)
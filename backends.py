@@ -0,0 +1,83 @@
+import contextlib
+import hashlib
+import os
+
+# "eager" is the fp32 PyTorch model; "int8" quantizes its Linear layers dynamically;
+# "bf16" runs generate under CPU bfloat16 autocast; "onnx" is an ONNX Runtime
+# encoder/decoder export with KV cache (optimum); "stub" is a deterministic,
+# model-free stand-in for offline benchmarks and pipeline checks.
+BACKENDS = ["eager", "int8", "bf16", "onnx", "stub"]
+# Backends whose outputs differ from fp32 and must pass quality_gate first.
+OPTIMIZED_BACKENDS = ["int8", "bf16", "onnx"]
+ONNX_DIR = os.path.join("cache", "onnx")
+
+def _check(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name!r}, expected one of {BACKENDS}")
+    return name
+
+BACKEND = _check(os.environ.get("LLM_BACKEND", "eager"))
+
+def set_backend(name):
+    # Also exported so spawned generation workers pick the same backend.
+    global BACKEND
+    BACKEND = _check(name)
+    os.environ["LLM_BACKEND"] = name
+
+@contextlib.contextmanager
+def using(name):
+    global BACKEND
+    previous = BACKEND
+    BACKEND = _check(name)
+    try:
+        yield
+    finally:
+        BACKEND = previous
+
+def load_model(model_name, backend=None, **kwargs):
+    # kwargs go to from_pretrained for the PyTorch backends; weights are loaded
+    # straight into the model instead of through a second full-size copy.
+    backend = backend or BACKEND
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        export_dir = os.path.join(ONNX_DIR, model_name.replace("/", "--"))
+        if os.path.isdir(export_dir):
+            return ORTModelForSeq2SeqLM.from_pretrained(export_dir, use_cache=True)
+        print(f"[backend] exporting {model_name} to ONNX → {export_dir}")
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True)
+        model.save_pretrained(export_dir)
+        return model
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name, low_cpu_mem_usage=True, **kwargs)
+    model.eval()
+    if backend == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def generation_context(backend=None):
+    # Wraps model.generate; only bf16 needs anything beyond inference mode.
+    if (backend or BACKEND) == "bf16":
+        import torch
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+def _seed(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+def stub_summarize(input_text: str, max_length=128) -> str:
+    # Lead-N words of the article part, with N derived from the input text.
+    article = input_text.split("Article:", 1)[-1].split()
+    n = min(max_length, 30 + _seed(input_text) % 40)
+    return " ".join(article[:n])
+
+def stub_rewrite(base_prompt: str, instruction: str, seed=0) -> str:
+    # A run of instruction words whose length and position depend on the seed, like a sampled rewrite.
+    words = instruction.split()
+    h = _seed(f"{seed}:{base_prompt}{instruction}")
+    k = 3 + h % 5
+    start = (h // 5) % max(1, len(words) - k + 1)
+    return f"{base_prompt.strip()} {' '.join(words[start:start + k])}"
+
+def stub_count_tokens(text: str) -> int:
+    return len(text.split())
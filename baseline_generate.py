@@ -1,44 +1,72 @@
-import json
+import argparse
 import os
-from llm_utils import MODEL_NAME, summarize_with_prompt
-from evaluation import evaluate_summary
+import assisted
+import backends
+from llm_utils import BATCH_SIZE, MODEL_NAME, report_cache, report_truncation, summarize_batch
+from corpus import ARTICLE_BLOCK, get_corpus
+from evaluation import evaluate_batch
+from long_doc import condense, report as report_long_doc
+from model_registry import get_registry
+from quality_gate import select_backend
+from results_store import ResultsStore
+from tracing import report as trace_report
 
 RESULT_DIR = "results"
 os.makedirs(RESULT_DIR, exist_ok=True)
-OUTPUT_FILE = os.path.join(RESULT_DIR, "baseline.json")
 
-def run_baseline(datasets):
+def run_baseline(datasets, batch_size=BATCH_SIZE, workers=1, long_docs=()):
+    # datasets: {name: sequence of {"id", "article", "reference"}}, e.g. lazy corpus views;
+    # articles are read and summarized ARTICLE_BLOCK at a time.
     results = []
     for dataset_name, samples in datasets.items():
         print(f"\n=== Running baseline summarization for {dataset_name} ({len(samples)} articles) ===")
-        for idx, (article, ref) in enumerate(samples):
-            summary = summarize_with_prompt(article, prompt=None)
-            scores = evaluate_summary(summary, ref, article)
-            record = {
-                "dataset": dataset_name,
-                "index": idx,
-                "summary": summary,
-                "rouge1": scores["rouge1"],
-                "rougel": scores["rougel"],
-                "fre": scores["fre"],
-                "compression": scores["compression"]
-            }
-            results.append(record)
-            print(f"[{dataset_name}] {idx+1}/{len(samples)} | R1={record['rouge1']:.3f} RL={record['rougel']:.3f}")
+        for start in range(0, len(samples), ARTICLE_BLOCK):
+            block = list(samples[start:start + ARTICLE_BLOCK])
+            articles = [item["article"] for item in block]
+            texts = articles
+            if dataset_name in long_docs:
+                condensed = condense(articles, batch_size, workers)
+                texts = [condensed[article] for article in articles]
+            summaries = summarize_batch([(None, text) for text in texts], batch_size=batch_size, workers=workers)
+            all_scores = evaluate_batch(summaries, [item["reference"] for item in block], articles)
+            for idx, (summary, scores) in enumerate(zip(summaries, all_scores), start):
+                record = {
+                    "dataset": dataset_name,
+                    "index": idx,
+                    "summary": summary,
+                    "rouge1": scores["rouge1"],
+                    "rougel": scores["rougel"],
+                    "fre": scores["fre"],
+                    "compression": scores["compression"]
+                }
+                results.append(record)
+                print(f"[{dataset_name}] {idx+1}/{len(samples)} | R1={record['rouge1']:.3f} RL={record['rougel']:.3f}")
     return results
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="number of generation processes")
+    parser.add_argument("--long-doc", action="append", default=[], metavar="DATASET",
+                        help="summarize this dataset's long articles chunk by chunk, then reduce (repeatable)")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND,
+                        help="LLM backend; optimized ones must pass the fp32 quality gate")
+    parser.add_argument("--assist", nargs="?", const=assisted.DEFAULT_DRAFT_MODEL, default=assisted.DRAFT_MODEL,
+                        metavar="DRAFT_MODEL", help="assisted decoding with a draft model (default flan-t5-small)")
+    parser.add_argument("--assist-lookahead", type=int, default=assisted.LOOKAHEAD, help="draft tokens per step")
+    args = parser.parse_args()
+    select_backend(args.backend)
+    assisted.configure(args.assist, args.assist_lookahead)
+
     print(f"Using model: {MODEL_NAME}")
-    with open("data/cnn_input.json", "r", encoding="utf-8") as f:
-        cnn_data = json.load(f)
-    with open("data/xsum_input.json", "r", encoding="utf-8") as f:
-        xsum_data = json.load(f)
-    datasets = {
-        "cnn": [(item["article"], item["reference"]) for item in cnn_data],
-        "xsum": [(item["article"], item["reference"]) for item in xsum_data]
-    }
+    datasets = get_corpus().load()
 
-    results = run_baseline(datasets)
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-    print(f"\nBaseline results saved to {OUTPUT_FILE}")
+    results = run_baseline(datasets, workers=args.workers, long_docs=args.long_doc)
+    store = ResultsStore()
+    store.write_baseline(results)
+    print(f"\nBaseline results saved to {store.path}")
+    report_cache()
+    report_truncation()
+    report_long_doc()
+    assisted.report()
+    trace_report("Baseline")
+    get_registry().report()
@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(REPO_DIR, "data")
+BENCH_DIR = os.path.join(REPO_DIR, "benchmarks")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "latest.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+STAGES = ["query_t5", "summarize_batch", "evaluate_summary", "generate_with_model", "run_evolution"]
+ARTICLES_PER_DATASET = 4
+PROMPTS_PER_ARTICLE = 2
+REGRESSION_TOLERANCE = 0.10
+# Stages shorter than this (typical for the stub backend) are reported but not
+# flagged: timer noise dominates at that scale.
+MIN_COMPARABLE_SECONDS = 0.05
+
+def load_inputs(n):
+    from corpus import get_corpus
+    articles = []
+    corpus = get_corpus()
+    for dataset_name in ["cnn", "xsum"]:
+        for item in corpus.head(dataset_name, n):
+            articles.append(dict(item, dataset=dataset_name))
+    with open(os.path.join(DATA_DIR, "initial_prompts.json"), "r", encoding="utf-8") as f:
+        prompts = json.load(f)
+    return articles, prompts
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def _stats(latencies, items, tokens):
+    seconds = sum(latencies)
+    return {
+        "calls": len(latencies),
+        "items": items,
+        "seconds": seconds,
+        "items_per_sec": items / seconds if seconds else None,
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "tokens_generated": tokens,
+        "tokens_per_sec": tokens / seconds if seconds and tokens is not None else None
+    }
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - start, out
+
+def bench_query_t5(articles, prompts):
+    import llm_utils
+    llm_utils.warm_up()
+    latencies, tokens = [], 0
+    for item in articles:
+        for p in prompts[:PROMPTS_PER_ARTICLE]:
+            dt, summary = _timed(llm_utils.query_t5, llm_utils.build_input(item["article"], p["text"]))
+            latencies.append(dt)
+            tokens += llm_utils.count_tokens(summary)
+    return _stats(latencies, len(latencies), tokens)
+
+def bench_summarize_batch(articles, prompts):
+    import llm_utils
+    llm_utils.warm_up()
+    pairs = [(p["text"], item["article"]) for item in articles for p in prompts[:PROMPTS_PER_ARTICLE]]
+    dt, summaries = _timed(llm_utils.summarize_batch, pairs)
+    return _stats([dt], len(pairs), sum(llm_utils.count_tokens(s) for s in summaries))
+
+def bench_evaluate_summary(articles, prompts):
+    import evaluation
+    evaluation.warm_up()
+    latencies = []
+    for item in articles:
+        for k in range(PROMPTS_PER_ARTICLE):
+            # Lead-N words as a fixed, distinct stand-in summary per call.
+            summary = " ".join(item["article"].split()[k:k + 60])
+            dt, _ = _timed(evaluation.evaluate_summary, summary, item["reference"], item["article"])
+            latencies.append(dt)
+    return _stats(latencies, len(latencies), None)
+
+def bench_generate_with_model(articles, prompts):
+    import generate_prompts
+    import llm_utils
+    from mutations import MUTATION_GUIDELINES
+    generate_prompts.warm_up()
+    latencies, tokens = [], 0
+    for p in prompts:
+        for mtype, instruction in MUTATION_GUIDELINES.items():
+            if mtype == "stepwise_prompt":
+                continue
+            dt, text = _timed(generate_prompts.generate_with_model, p["text"], instruction)
+            latencies.append(dt)
+            tokens += llm_utils.count_tokens(text)
+    return _stats(latencies, len(latencies), tokens)
+
+def bench_run_evolution(articles, prompts):
+    import llm_utils
+    from evolution import run_evolution
+    from prompt_registry import PromptRegistry
+    from results_store import ResultsStore
+    llm_utils.warm_up()
+    datasets = {}
+    for item in articles:
+        datasets.setdefault(item["dataset"], []).append({k: item[k] for k in ["id", "article", "reference"]})
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.makedirs("data")
+        candidates = [{"parent_name": p["name"], "mutation": "none", "prompt_text": p["text"]} for p in prompts]
+        with open("candidates.json", "w", encoding="utf-8") as f:
+            json.dump(candidates, f)
+        PromptRegistry().reset()
+        dt, _ = _timed(run_evolution, datasets, "candidates.json", 1)
+        store = ResultsStore()
+        summaries = [r["summary"] for r in store.iter_round(1)]
+        store.close()
+        os.chdir(REPO_DIR)
+    return _stats([dt], len(summaries), sum(llm_utils.count_tokens(s) for s in summaries))
+
+def run_stage(stage, n):
+    articles, prompts = load_inputs(n)
+    stats = globals()[f"bench_{stage}"](articles, prompts)
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats["peak_rss_mb"] = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    return stats
+
+def run_suite(stages, n, backend):
+    # Each stage runs in a fresh interpreter so peak RSS is per stage.
+    # Spans stay on (that is the normal configuration) but go to a scratch trace file.
+    trace_path = os.path.join(BENCH_DIR, "trace.jsonl")
+    if os.path.exists(trace_path):
+        os.remove(trace_path)
+    env = dict(os.environ, LLM_BACKEND=backend, SUMMARY_CACHE="0", TRACE_PATH=trace_path)
+    results = {}
+    for stage in stages:
+        print(f"[bench] {stage} ...", flush=True)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-stage", stage, "--articles", str(n)],
+            capture_output=True, text=True, env=env, cwd=REPO_DIR
+        )
+        if proc.returncode != 0:
+            lines = [l for l in proc.stderr.strip().splitlines() if l.strip() and not l.startswith("*")]
+            error = next((l for l in reversed(lines) if "Error" in l), lines[-1] if lines else "failed")
+            print(f"[bench] {stage} failed: {error}")
+            results[stage] = {"error": error}
+            continue
+        results[stage] = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "backend": backend,
+        "articles_per_dataset": n,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "stages": results
+    }
+
+def print_report(report):
+    print(f"\n{'stage':<22}{'items/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'tok/s':>10}{'RSS MB':>10}")
+    for stage, s in report["stages"].items():
+        if "error" in s:
+            print(f"{stage:<22}  error: {s['error']}")
+            continue
+        fmt = lambda v, spec: format(v, spec) if v is not None else f"{'-':>10}"
+        print(f"{stage:<22}{fmt(s['items_per_sec'], '10.2f')}{fmt(s['p50_ms'], '10.1f')}"
+              f"{fmt(s['p95_ms'], '10.1f')}{fmt(s['tokens_per_sec'], '10.1f')}{fmt(s['peak_rss_mb'], '10.1f')}")
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    if baseline.get("backend") != report["backend"]:
+        print(f"\n[bench] baseline backend {baseline.get('backend')!r} differs from {report['backend']!r}; not comparing")
+        return []
+    regressions = []
+    print(f"\n{'stage':<22}{'items/s':>12}{'p95':>12}{'RSS':>12}   (current / baseline)")
+    for stage, s in report["stages"].items():
+        b = baseline.get("stages", {}).get(stage)
+        if not b or "error" in s or "error" in b:
+            continue
+        ratios = {}
+        for metric in ["items_per_sec", "p95_ms", "peak_rss_mb"]:
+            if s.get(metric) and b.get(metric):
+                ratios[metric] = s[metric] / b[metric]
+        if min(s["seconds"], b["seconds"]) < MIN_COMPARABLE_SECONDS:
+            ratios = {"peak_rss_mb": ratios["peak_rss_mb"]} if "peak_rss_mb" in ratios else {}
+        if ratios.get("items_per_sec", 1.0) < 1 - tolerance:
+            regressions.append(f"{stage}: throughput {ratios['items_per_sec']:.2f}x")
+        if ratios.get("p95_ms", 1.0) > 1 + tolerance:
+            regressions.append(f"{stage}: p95 latency {ratios['p95_ms']:.2f}x")
+        if ratios.get("peak_rss_mb", 1.0) > 1 + tolerance:
+            regressions.append(f"{stage}: peak RSS {ratios['peak_rss_mb']:.2f}x")
+        cols = "".join(f"{ratios[m]:>11.2f}x" if m in ratios else f"{'-':>12}"
+                       for m in ["items_per_sec", "p95_ms", "peak_rss_mb"])
+        print(f"{stage:<22}{cols}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generate → score → select pipeline")
+    parser.add_argument("--backend", default="stub", help="LLM backend (stub runs offline in seconds)")
+    parser.add_argument("--articles", type=int, default=ARTICLES_PER_DATASET, help="articles per dataset")
+    parser.add_argument("--stage", action="append", choices=STAGES, help="run only these stages")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, args.articles)))
+        return
+
+    report = run_suite(args.stage or STAGES, args.articles, args.backend)
+    print_report(report)
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[bench] results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f))
+        if regressions:
+            print("\n[bench] regressions: " + "; ".join(regressions))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
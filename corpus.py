@@ -0,0 +1,226 @@
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import uuid
+
+CORPUS_DIR = os.path.join("data", "corpus")
+SHARD_SIZE = 1000
+# Scripts read and generate this many articles at a time, so memory does not grow with the corpus.
+ARTICLE_BLOCK = 1000
+# Sampled JSON files from before the corpus existed; imported once when no corpus is present.
+LEGACY_FILES = {"cnn": os.path.join("data", "cnn_input.json"), "xsum": os.path.join("data", "xsum_input.json")}
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+class CorpusWriter:
+    # Streams records of one dataset into <root>/<name>@<version>/shard-NNNNN.jsonl plus an
+    # index.json of id -> [shard, byte offset]. On close the manifest is switched to the new
+    # version in one atomic replace (under a lock, so writers of other datasets keep their
+    # entries); readers never see a half-written or missing dataset. The version before it
+    # is kept for readers still holding the old manifest; the one before that is removed.
+    def __init__(self, name, root=CORPUS_DIR, shard_size=SHARD_SIZE):
+        self.name = name
+        self.root = root
+        self.shard_size = shard_size
+        self.version = f"{name}@{uuid.uuid4().hex[:12]}"
+        self.dir = os.path.join(root, self.version)
+        os.makedirs(self.dir)
+        self.index = {}
+        self.count = 0
+        self._shard = None
+
+    def add(self, record):
+        if record["id"] in self.index:
+            raise ValueError(f"Duplicate article id {record['id']!r} in dataset {self.name!r}")
+        if self.count % self.shard_size == 0:
+            if self._shard is not None:
+                self._shard.close()
+            self._shard = open(os.path.join(self.dir, f"shard-{self.count // self.shard_size:05d}.jsonl"), "wb")
+        self.index[record["id"]] = [self.count // self.shard_size, self._shard.tell()]
+        self._shard.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.count += 1
+
+    def close(self):
+        if self._shard is not None:
+            self._shard.close()
+        _write_json(os.path.join(self.dir, "index.json"), self.index)
+        manifest_path = os.path.join(self.root, "manifest.json")
+        with open(os.path.join(self.root, "manifest.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = {}
+            if os.path.exists(manifest_path):
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            old = manifest.get(self.name)
+            previous = old.get("dir", self.name) if old else None
+            manifest[self.name] = {"count": self.count, "shards": -(-self.count // self.shard_size),
+                                   "dir": self.version, "previous": previous}
+            _write_json(manifest_path, manifest)
+            # Only the version the manifest itself recorded as superseded is removed, and only
+            # under the lock, so another writer's directory in progress is never touched.
+            superseded = old.get("previous") if old else None
+            if superseded and superseded not in (self.version, previous):
+                shutil.rmtree(os.path.join(self.root, superseded), ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            if self._shard is not None:
+                self._shard.close()
+            shutil.rmtree(self.dir, ignore_errors=True)
+        return False
+
+class Dataset:
+    # Lazy view of a dataset, or of a contiguous slice of it: len() comes from the manifest,
+    # iteration streams the shards from the slice start, and an indexed item is read at its
+    # byte offset. Slicing returns another view, so nothing is materialized until asked for.
+    def __init__(self, corpus, name, start=0, stop=None):
+        count = corpus.count(name)
+        self.corpus = corpus
+        self.name = name
+        self.start = min(start, count)
+        self.stop = count if stop is None else max(self.start, min(stop, count))
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        return self.corpus.iter_dataset(self.name, limit=len(self), start=self.start)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError("Dataset views only take contiguous slices")
+            return Dataset(self.corpus, self.name, self.start + start, self.start + max(start, stop))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Article {i} out of range for dataset {self.name!r}")
+        return self.corpus.read(self.name, self.start + i)
+
+class Corpus:
+    # Opening a corpus reads only manifest.json; a dataset's id index is read on the
+    # first lookup by id or position, and articles are read from the shards when asked for.
+    def __init__(self, root=CORPUS_DIR):
+        self.root = root
+        self.manifest = {}
+        path = os.path.join(root, "manifest.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        self._indexes = {}
+        self._positions = {}
+
+    def names(self):
+        return list(self.manifest)
+
+    def count(self, name):
+        return self.manifest[name]["count"]
+
+    def _dir(self, name):
+        # Corpora written before versioned directories keep the dataset in <root>/<name>.
+        return os.path.join(self.root, self.manifest[name].get("dir", name))
+
+    def _shard_path(self, name, shard):
+        return os.path.join(self._dir(name), f"shard-{shard:05d}.jsonl")
+
+    def iter_dataset(self, name, limit=None, start=0):
+        if name not in self.manifest:
+            raise KeyError(f"No dataset {name!r} in corpus {self.root}")
+        if start >= self.count(name):
+            return
+        first, offset = self._entries(name)[start] if start else (0, 0)
+        n = 0
+        for shard in range(first, self.manifest[name]["shards"]):
+            with open(self._shard_path(name, shard), "rb") as f:
+                if shard == first:
+                    f.seek(offset)
+                for line in f:
+                    if limit is not None and n >= limit:
+                        return
+                    yield json.loads(line)
+                    n += 1
+
+    def head(self, name, n):
+        return list(self.iter_dataset(name, limit=n))
+
+    def _index(self, name):
+        if name not in self._indexes:
+            with open(os.path.join(self._dir(name), "index.json"), "r", encoding="utf-8") as f:
+                self._indexes[name] = json.load(f)
+        return self._indexes[name]
+
+    def _entries(self, name):
+        # [shard, offset] by position; the index keeps the order articles were written in.
+        if name not in self._positions:
+            self._positions[name] = list(self._index(name).values())
+        return self._positions[name]
+
+    def read(self, name, position):
+        shard, offset = self._entries(name)[position]
+        with open(self._shard_path(name, shard), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def get(self, article_id, name=None):
+        for dataset in [name] if name else self.names():
+            entry = self._index(dataset).get(article_id)
+            if entry is not None:
+                shard, offset = entry
+                with open(self._shard_path(dataset, shard), "rb") as f:
+                    f.seek(offset)
+                    return json.loads(f.readline())
+        raise KeyError(f"No article {article_id!r} in corpus {self.root}")
+
+    def load(self, names=None, limit=None):
+        # {dataset: lazy sequence of {"id", "article", "reference"}} as run_evolution/run_baseline take it.
+        return {name: Dataset(self, name, stop=limit or None) for name in names or self.names()}
+
+def import_json(name, path, root=CORPUS_DIR):
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    with CorpusWriter(name, root) as writer:
+        for record in records:
+            writer.add(record)
+    return len(records)
+
+def get_corpus(root=CORPUS_DIR):
+    corpus = Corpus(root)
+    if not corpus.manifest and root == CORPUS_DIR:
+        for name, path in LEGACY_FILES.items():
+            if os.path.exists(path):
+                print(f"[corpus] importing {path} → {os.path.join(root, name)}")
+                import_json(name, path, root)
+        corpus = Corpus(root)
+    return corpus
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded JSONL article corpus")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="import a JSON array of {id, article, reference} as a dataset")
+    p.add_argument("name")
+    p.add_argument("path")
+    sub.add_parser("info")
+    p = sub.add_parser("get")
+    p.add_argument("article_id")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f"Imported {import_json(args.name, args.path)} articles into {os.path.join(CORPUS_DIR, args.name)}")
+    elif args.command == "info":
+        corpus = get_corpus()
+        for name in corpus.names():
+            print(f"{name:<10} {corpus.count(name):>8} articles  {corpus.manifest[name]['shards']} shards")
+    else:
+        print(json.dumps(get_corpus().get(args.article_id), ensure_ascii=False, indent=2))
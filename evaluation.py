@@ -1,15 +1,80 @@
-import evaluate
-import textstat
+from collections import Counter
+from functools import lru_cache
+from tracing import span
 
-rouge = evaluate.load("rouge")
+MEMO_SIZE = 65536
+_tokenizer = None
+
+# Same tokenization as evaluate's "rouge" metric (rouge_score, no stemming),
+# applied once per distinct text instead of once per compute() call.
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        from rouge_score.tokenizers import DefaultTokenizer
+        _tokenizer = DefaultTokenizer(use_stemmer=False)
+    return _tokenizer
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _tokenize(text):
+    tokens = tuple(get_tokenizer().tokenize(text))
+    return tokens, Counter(tokens)
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _word_count(text):
+    return len(text.split())
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _fre(summary):
+    import textstat
+    with span("fre"):
+        return textstat.flesch_reading_ease(summary)
+
+def _fmeasure(overlap, pred_len, ref_len):
+    precision = overlap / max(pred_len, 1)
+    recall = overlap / max(ref_len, 1)
+    if precision + recall > 0:
+        return 2 * precision * recall / (precision + recall)
+    return 0.0
+
+def _lcs_length(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    prev = [0] * (len(b) + 1)
+    for x in a:
+        curr = [0]
+        for j, y in enumerate(b, start=1):
+            curr.append(prev[j - 1] + 1 if x == y else max(prev[j], curr[j - 1]))
+        prev = curr
+    return prev[-1]
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _rouge(summary, reference):
+    # Memo misses only: cached pairs cost nothing and are not traced.
+    with span("rouge") as sp:
+        pred_tokens, pred_counts = _tokenize(summary)
+        ref_tokens, ref_counts = _tokenize(reference)
+        overlap = sum((pred_counts & ref_counts).values())
+        rouge1 = _fmeasure(overlap, len(pred_tokens), len(ref_tokens))
+        rougel = _fmeasure(_lcs_length(pred_tokens, ref_tokens), len(pred_tokens), len(ref_tokens))
+        sp.set(tokens=len(pred_tokens) + len(ref_tokens))
+    return rouge1, rougel
 
 def evaluate_summary(summary, reference, article):
-    scores = rouge.compute(predictions=[summary], references=[reference])
-    fre_score = textstat.flesch_reading_ease(summary)
-    compression = len(summary.split()) / max(1, len(article.split()))
+    rouge1, rougel = _rouge(summary, reference)
+    fre_score = _fre(summary)
+    compression = _word_count(summary) / max(1, _word_count(article))
     return {
-        "rouge1": scores["rouge1"],
-        "rougel": scores["rougeL"],
+        "rouge1": rouge1,
+        "rougel": rougel,
         "fre": fre_score,
         "compression": compression
     }
+
+def evaluate_batch(summaries, references, articles):
+    return [evaluate_summary(s, r, a) for s, r, a in zip(summaries, references, articles)]
+
+def cache_info():
+    return {"rouge": _rouge.cache_info(), "fre": _fre.cache_info(), "tokenize": _tokenize.cache_info()}
+
+def warm_up():
+    evaluate_summary("Warm up the metrics.", "Warm up the metrics.", "Warm up the metrics engine.")
@@ -1,94 +1,339 @@
+import argparse
+import contextlib
+from array import array
 import json
 import os
-from llm_utils import summarize_with_prompt
+import math
+import assisted
+import backends
+from llm_utils import BATCH_SIZE, iter_summarize, report_cache, report_truncation
+from corpus import ARTICLE_BLOCK, get_corpus
 from evaluation import evaluate_summary
+from long_doc import condense, report as report_long_doc
+from model_registry import get_registry
+from pipeline import ScoringPipeline
+from prompt_registry import FitnessAggregator, PromptRegistry, article_set_id, top_k_prompts
+from quality_gate import select_backend
+from results_store import ResultsStore
+from tracing import Progress, report as trace_report, span
+from work_queue import Coordinator
 
-def run_evolution(datasets, prompt_file, round_idx=1, rouge1_threshold=0.5, top_k=5):
+RACE_INITIAL_ARTICLES = 8
+RACE_Z = 1.96
+
+def _prompt_text(cand):
+    return cand["text"] if "text" in cand else cand["prompt_text"]
+
+def load_checkpoint_offsets(path, cell_of, n_cells):
+    # Byte offset (-1 if not done) and ROUGE-1 of each completed record, indexed by grid cell
+    # (article_idx * candidates + candidate_idx); a torn last line from a crash is cut off.
+    offsets = array("q", [-1]) * n_cells
+    rouge1 = array("d", [0.0]) * n_cells
+    if not os.path.exists(path):
+        return offsets, rouge1
+    with open(path, "r+b") as f:
+        while True:
+            pos = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            try:
+                r = json.loads(line)
+            except ValueError:
+                f.truncate(pos)
+                break
+            cell = cell_of(r)
+            if cell is not None:
+                offsets[cell] = pos
+                rouge1[cell] = r["rouge1"]
+    return offsets, rouge1
+
+def iter_checkpoint(path, positions):
+    with open(path, "rb") as f:
+        for pos in positions:
+            f.seek(pos)
+            yield json.loads(f.readline())
+
+def _race_order(articles):
+    # Interleave datasets so every racing stage sees a balanced article subset.
+    by_dataset = {}
+    for a_idx, (dataset_name, _) in enumerate(articles):
+        by_dataset.setdefault(dataset_name, []).append(a_idx)
+    order = []
+    for i in range(max((len(v) for v in by_dataset.values()), default=0)):
+        for idxs in by_dataset.values():
+            if i < len(idxs):
+                order.append(idxs[i])
+    return order
+
+def _race_survivors(survivors, scores, top_k, z=RACE_Z):
+    # Every survivor is scored on the same articles, so each one is compared with the current
+    # k-th best on per-article ROUGE-1 differences; it is dropped when the upper bound of the
+    # mean difference is below zero. Pairing removes the article-difficulty variance.
+    if top_k <= 0 or len(survivors) <= top_k:
+        return survivors
+    ranked = sorted(survivors, key=lambda c: sum(scores[c]) / len(scores[c]), reverse=True)
+    kth = scores[ranked[top_k - 1]]
+    kept = []
+    for c_idx in survivors:
+        diffs = [v - w for v, w in zip(scores[c_idx], kth)]
+        mean = sum(diffs) / len(diffs)
+        var = sum((d - mean) ** 2 for d in diffs) / (len(diffs) - 1) if len(diffs) > 1 else 0.0
+        if mean + z * math.sqrt(var / len(diffs)) >= 0:
+            kept.append(c_idx)
+    return kept
+
+def run_evolution(datasets, prompt_file, round_idx=1, rouge1_threshold=0.5, top_k=5, batch_size=BATCH_SIZE, workers=1,
+                  resume=False, racing=False, race_articles=RACE_INITIAL_ARTICLES, pipeline=False, scorers=2,
+                  queue_dir=None, local_workers=0, long_docs=(), run_id=None):
     RESULT_DIR = "results"
     os.makedirs(RESULT_DIR, exist_ok=True)
-    meet_file = os.path.join(RESULT_DIR, "meet_threshold.json")
-    selected_file = os.path.join(RESULT_DIR, "selected_topk.json")
-    open(meet_file, "a").close()
-    open(selected_file, "a").close()
+    checkpoint_file = os.path.join(RESULT_DIR, f"round_{round_idx}_checkpoint.jsonl")
 
     with open(prompt_file, "r", encoding="utf-8") as f:
         candidates = json.load(f)
 
     print(f"\n=== Round {round_idx} | candidates={len(candidates)} ===")
-    results = []
-    total = sum(len(samples) * len(candidates) for samples in datasets.values())
-    count = 0
-
-    for dataset_name, samples in datasets.items():
-        for item in samples:
-            article_id = item["id"]
-            article = item["article"]
-            ref = item["reference"]
-            for cand in candidates:
-                parent_name = cand.get("parent_name", cand.get("name", f"round{round_idx}_unknown"))
-                mutation = cand.get("mutation", "none")
-                summary = summarize_with_prompt(article, cand["text"] if "text" in cand else cand["prompt_text"])
-                scores = evaluate_summary(summary, ref, article)
-                record = {
-                    "round": round_idx,
-                    "dataset": dataset_name,
-                    "article_id": article_id,
-                    "parent_name": parent_name,
-                    "mutation": mutation,
-                    "prompt_text": cand["text"] if "text" in cand else cand["prompt_text"],
-                    "summary": summary,
-                    "rouge1": scores["rouge1"],
-                    "rougel": scores["rougel"],
-                    "fre": scores["fre"],
-                    "compression": scores["compression"]
-                }
-                results.append(record)
-                count += 1
-                if count % 10 == 0:
-                    print(f"[Round {round_idx}] Progress: {count}/{total} ({count/total:.1%})")
-
-    with open(os.path.join(RESULT_DIR, f"round_{round_idx}_results.json"), "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-
-    meet = [r for r in results if r["rouge1"] >= rouge1_threshold]
-    remain = [r for r in results if r["rouge1"] < rouge1_threshold]
-
-    if meet:
-        with open(meet_file, "a", encoding="utf-8") as f:
-            for item in meet:
-                item["meet_round"] = round_idx
-                f.write(json.dumps(item, ensure_ascii=False) + "\n")
-
-    remain.sort(key=lambda x: x["rouge1"], reverse=True)
-    selected = remain[:top_k]
-
-    if selected:
-        with open(selected_file, "a", encoding="utf-8") as f:
-            for item in selected:
-                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    if not resume and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    # (dataset, position) per article; the samples may be lazy corpus views, and article
+    # texts are only read a block at a time while the grid is generated.
+    articles = [(dataset_name, i) for dataset_name, samples in datasets.items() for i in range(len(samples))]
+    long_docs = set(long_docs or ())
+    if long_docs - set(datasets):
+        raise ValueError(f"--long-doc names unknown datasets: {sorted(long_docs - set(datasets))}")
+    registry = PromptRegistry()
+    # Rounds of one run_all share a run; a standalone round starts one unless it resumes.
+    if run_id is None:
+        run_id = registry.last_run() if resume else registry.new_run()
+    article_set = article_set_id(datasets)
+    cand_meta = []
+    cand_ids = []
+    carried = []
+    seen_ids = set()
+    for cand in candidates:
+        parent_name = cand.get("parent_name", cand.get("name", f"round{round_idx}_unknown"))
+        mutation = cand.get("mutation", "none")
+        prompt_id = registry.register(_prompt_text(cand), parent_name, mutation, round_idx)
+        if prompt_id in seen_ids:
+            continue
+        seen_ids.add(prompt_id)
+        # A prompt already scored in this run on this exact article set is not scheduled again;
+        # its stored fitness still competes in selection.
+        stats = registry.evaluated(prompt_id, run_id, article_set)
+        if stats is not None:
+            carried.append(stats)
+            continue
+        cand_meta.append((parent_name, mutation, _prompt_text(cand)))
+        cand_ids.append(prompt_id)
+    skipped = len(candidates) - len(cand_meta)
+    if skipped:
+        print(f"[Round {round_idx}] Skipping {skipped} candidates: {len(carried)} already evaluated on this "
+              f"article set, {skipped - len(carried)} duplicate prompt texts")
+    next_prompt_file = f"data/round_{round_idx+1}_prompts.json"
+    if not cand_meta:
+        # Selection over stored fitness alone would only repeat this round's parents.
+        print(f"[Round {round_idx}] No new candidates to evaluate; evolution has converged")
+        if os.path.exists(next_prompt_file):
+            os.remove(next_prompt_file)
+        return
+
+    # Cells of the article × candidate grid are plain ints, so the resume index costs a few
+    # bytes per cell rather than a copy of every record's identity.
+    n_cand = len(cand_meta)
+    full_grid = len(articles) * n_cand
+    article_idx = {}
+    cand_idx = {meta: c_idx for c_idx, meta in enumerate(cand_meta)}
+
+    def cell_of(r):
+        if not article_idx:
+            # Only needed to resume: one streaming pass over the articles for their ids.
+            items = ((dataset_name, item) for dataset_name, samples in datasets.items() for item in samples)
+            article_idx.update(((d, item["id"]), a_idx) for a_idx, (d, item) in enumerate(items))
+        a_idx = article_idx.get((r["dataset"], r["article_id"]))
+        c_idx = cand_idx.get((r["parent_name"], r["mutation"], r["prompt_text"]))
+        return None if a_idx is None or c_idx is None else a_idx * n_cand + c_idx
+
+    offsets, rouge1_by_cell = load_checkpoint_offsets(checkpoint_file, cell_of, full_grid)
+    resumed = full_grid - offsets.count(-1)
+    if resumed:
+        print(f"[Round {round_idx}] Resuming: {resumed} records already in {checkpoint_file}")
+
+    evaluated = bytearray(full_grid)
+
+    def evaluate_articles(article_idxs, cand_idxs, ckpt, pipe):
+        # Generates the given sub-grid in blocks of ARTICLE_BLOCK articles, so only one block
+        # of article texts is held at a time however large the corpus is.
+        todo = sum(1 for a in article_idxs for c in cand_idxs
+                   if not evaluated[a * n_cand + c] and offsets[a * n_cand + c] < 0)
+        progress = Progress(todo, f"Round {round_idx}")
+        for start in range(0, len(article_idxs), ARTICLE_BLOCK):
+            block = article_idxs[start:start + ARTICLE_BLOCK]
+            evaluate_cells([(a, c) for a in block for c in cand_idxs], ckpt, pipe, progress)
+        progress.close()
+
+    def evaluate_cells(cells, ckpt, pipe, progress):
+        pending = []
+        for a_idx, c_idx in cells:
+            cell = a_idx * n_cand + c_idx
+            if not evaluated[cell]:
+                evaluated[cell] = 1
+                if offsets[cell] < 0:
+                    pending.append((cell, a_idx, c_idx))
+        items = {}
+        for _, a_idx, _ in pending:
+            if a_idx not in items:
+                dataset_name, i = articles[a_idx]
+                items[a_idx] = datasets[dataset_name][i]
+        # Generation input per article: the article itself, or its joined chunk summaries for
+        # datasets in long-document mode. Scoring always uses the original article.
+        long_texts = [item["article"] for a_idx, item in items.items() if articles[a_idx][0] in long_docs]
+        condensed = condense(long_texts, batch_size, workers) if long_texts else {}
+        def text(a_idx):
+            article = items[a_idx]["article"]
+            return condensed[article] if articles[a_idx][0] in long_docs else article
+        pairs = [(cand_meta[c_idx][2], text(a_idx)) for _, a_idx, c_idx in pending]
+        def lookup(i):
+            item = items[pending[i][1]]
+            return item["reference"], item["article"]
+
+        if isinstance(pipe, Coordinator):
+            # Workers on any host generate and score; results arrive unit by unit.
+            scored = pipe.run(f"round_{round_idx}", [(i, *pairs[i], *lookup(i)) for i in range(len(pending))])
+        elif pipe is None:
+            results = iter_summarize(pairs, batch_size=batch_size, workers=workers)
+            scored = ((i, summary, evaluate_summary(summary, *lookup(i))) for i, summary in results)
+        else:
+            scored = pipe.run(iter_summarize(pairs, batch_size=batch_size, workers=workers), lookup)
+        for i, summary, scores in scored:
+            cell, a_idx, c_idx = pending[i]
+            dataset_name, item = articles[a_idx][0], items[a_idx]
+            parent_name, mutation, prompt_text = cand_meta[c_idx]
+            record = {
+                "round": round_idx,
+                "dataset": dataset_name,
+                "article_id": item["id"],
+                "prompt_id": cand_ids[c_idx],
+                "parent_name": parent_name,
+                "mutation": mutation,
+                "prompt_text": prompt_text,
+                "summary": summary,
+                "rouge1": scores["rouge1"],
+                "rougel": scores["rougel"],
+                "fre": scores["fre"],
+                "compression": scores["compression"]
+            }
+            offsets[cell] = ckpt.tell()
+            rouge1_by_cell[cell] = record["rouge1"]
+            with span("checkpoint_write"):
+                ckpt.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                ckpt.flush()
+            progress.update()
+
+    if queue_dir:
+        executor = Coordinator(queue_dir, local_workers)
+    elif pipeline:
+        executor = ScoringPipeline(scorers)
+    else:
+        executor = contextlib.nullcontext()
+    with open(checkpoint_file, "ab") as ckpt, executor as pipe:
+        if not racing:
+            evaluate_articles(range(len(articles)), range(n_cand), ckpt, pipe)
+        else:
+            order = _race_order(articles)
+            survivors = list(range(n_cand))
+            scores = {c: [] for c in survivors}
+            seen = 0
+            stage_size = max(2, race_articles)
+            while seen < len(order) and survivors:
+                stage = order[seen:seen + stage_size]
+                evaluate_articles(stage, survivors, ckpt, pipe)
+                for c in survivors:
+                    scores[c].extend(rouge1_by_cell[a * n_cand + c] for a in stage)
+                seen += len(stage)
+                stage_size *= 2
+                before = len(survivors)
+                survivors = _race_survivors(survivors, scores, top_k)
+                print(f"[Round {round_idx}] Racing: {seen}/{len(order)} articles, "
+                      f"{len(survivors)}/{before} candidates still in contention")
+            saved = full_grid - evaluated.count(1)
+            print(f"[Round {round_idx}] Racing evaluated {evaluated.count(1)}/{full_grid} records, "
+                  f"saved {saved} generate calls ({saved / max(1, full_grid):.1%})")
+    report_cache()
+    report_truncation()
+    report_long_doc()
+    assisted.report()
+
+    # One streaming pass over the checkpoint in grid order: write the round partition,
+    # collect threshold hits and aggregate fitness per prompt.
+    store = ResultsStore()
+    aggregator = FitnessAggregator()
+    meet = []
+
+    def stream():
+        positions = (offsets[cell] for cell in range(full_grid) if evaluated[cell])
+        for r in iter_checkpoint(checkpoint_file, positions):
+            yield r
+            aggregator.add(r)
+            if r["rouge1"] >= rouge1_threshold:
+                meet.append(r)
+
+    n_evaluated = evaluated.count(1)
+    with span("store_write", items=n_evaluated):
+        store.write_round(round_idx, stream())
+        store.write_meet(round_idx, meet)
+    os.remove(checkpoint_file)
+
+    fresh = list(aggregator.stats())
+    for stats in fresh:
+        if stats["n_articles"] == len(articles):
+            registry.record_evaluation(stats["prompt_id"], run_id, article_set, round_idx, stats)
+
+    selected = top_k_prompts(fresh + carried, top_k, rouge1_threshold)
+    store.write_selected(round_idx, selected)
+    store.close()
+    print(f"[Round {round_idx}] {n_evaluated} records, {len(meet)} above threshold → {store.path}")
 
     next_round_prompts = []
     for s in selected:
         next_round_prompts.append({
             "name": s["parent_name"],
-            "text": s["prompt_text"]
+            "text": s["prompt_text"],
+            "prompt_id": s["prompt_id"]
         })
 
-    with open(f"data/round_{round_idx+1}_prompts.json", "w", encoding="utf-8") as f:
+    with open(next_prompt_file, "w", encoding="utf-8") as f:
         json.dump(next_round_prompts, f, ensure_ascii=False, indent=2)
 
-    print(f"Top {top_k} prompts saved for next round → data/round_{round_idx+1}_prompts.json")
+    print(f"Top {top_k} prompts saved for next round → {next_prompt_file}")
+    trace_report(f"Round {round_idx}")
 
 
 if __name__ == "__main__":
-    with open("data/cnn_input.json", "r", encoding="utf-8") as f:
-        cnn_data = json.load(f)
-    with open("data/xsum_input.json", "r", encoding="utf-8") as f:
-        xsum_data = json.load(f)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="number of generation processes")
+    parser.add_argument("--resume", action="store_true", help="continue from the round checkpoint")
+    parser.add_argument("--racing", action="store_true", help="prune candidates early on an article subset")
+    parser.add_argument("--pipeline", action="store_true", help="overlap generation, scoring and writing")
+    parser.add_argument("--scorers", type=int, default=2, help="scoring processes in --pipeline mode")
+    parser.add_argument("--queue", default=None, metavar="DIR",
+                        help="shared work directory; rounds are generated and scored by work_queue.py workers")
+    parser.add_argument("--local-workers", type=int, default=0, help="worker processes to start on this host with --queue")
+    parser.add_argument("--long-doc", action="append", default=[], metavar="DATASET",
+                        help="summarize this dataset's long articles chunk by chunk, then reduce (repeatable)")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND,
+                        help="LLM backend; optimized ones must pass the fp32 quality gate")
+    parser.add_argument("--assist", nargs="?", const=assisted.DEFAULT_DRAFT_MODEL, default=assisted.DRAFT_MODEL,
+                        metavar="DRAFT_MODEL", help="assisted decoding with a draft model (default flan-t5-small)")
+    parser.add_argument("--assist-lookahead", type=int, default=assisted.LOOKAHEAD, help="draft tokens per step")
+    args = parser.parse_args()
+    select_backend(args.backend)
+    assisted.configure(args.assist, args.assist_lookahead)
 
-    datasets = {
-        "cnn": [{"id": item["id"], "article": item["article"], "reference": item["reference"]} for item in cnn_data],
-        "xsum": [{"id": item["id"], "article": item["article"], "reference": item["reference"]} for item in xsum_data]
-    }
+    datasets = get_corpus().load()
 
-    run_evolution(datasets, "results/round_1_prompts.json", round_idx=1)
+    run_evolution(datasets, "results/round_1_prompts.json", round_idx=1, workers=args.workers, resume=args.resume,
+                  racing=args.racing, pipeline=args.pipeline, scorers=args.scorers, queue_dir=args.queue,
+                  local_workers=args.local_workers, long_docs=args.long_doc)
+    get_registry().report()
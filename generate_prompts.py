@@ -1,21 +1,58 @@
 import json
 import os
-import torch
-from transformers import T5Tokenizer, T5ForConditionalGeneration
+import assisted
+import backends
+from model_registry import get_registry
 from mutations import MUTATION_GUIDELINES
+from prompt_registry import PromptRegistry
+from summary_cache import get_cache, make_key
+from tracing import Progress, span
 
 PARAPHRASE_MODEL = "google/flan-t5-large"
-
-tokenizer = T5Tokenizer.from_pretrained(PARAPHRASE_MODEL)
-model = T5ForConditionalGeneration.from_pretrained(
-    PARAPHRASE_MODEL,
-    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
-)
+MUTATION_BATCH_SIZE = 8
+MUTATION_SEED = 0
+GENERATION_PARAMS = {
+    "max_input_length": 512,
+    "max_length": 96,
+    "do_sample": True,
+    "top_p": 0.9,
+    "temperature": 0.8,
+    "repetition_penalty": 1.15
+}
+STEPWISE_SUFFIX = " Always follow these steps: 1) Read the article, 2) Extract key facts, 3) Write a concise summary."
 
 MUTATION_NAMES = list(MUTATION_GUIDELINES.keys())
 
-def generate_with_model(base_prompt: str, instruction: str) -> str:
-    input_text = f"""
+_tokenizer = None
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        # Fast (Rust) tokenizer when available; falls back to sentencepiece otherwise.
+        _tokenizer = AutoTokenizer.from_pretrained(PARAPHRASE_MODEL, use_fast=True)
+    return _tokenizer
+
+def _load_model(backend):
+    kwargs = {}
+    if backend == "eager":
+        import torch
+        kwargs["torch_dtype"] = torch.float16 if torch.cuda.is_available() else torch.float32
+    return backends.load_model(PARAPHRASE_MODEL, backend, **kwargs)
+
+def get_model():
+    # Shared registry: under a memory budget the summarizer and this model take turns.
+    backend = backends.BACKEND
+    return get_registry().get((PARAPHRASE_MODEL, backend), lambda: _load_model(backend))
+
+def warm_up():
+    if backends.BACKEND == "stub":
+        return
+    get_tokenizer()
+    get_model()
+
+def build_rewrite_input(base_prompt: str, instruction: str) -> str:
+    return f"""
 You are a prompt rewriting assistant.
 Follow the given instruction to modify the following prompt.
 
@@ -24,72 +61,145 @@ Prompt: {base_prompt}
 
 Return only the rewritten prompt:
 """
-    encoding = tokenizer.encode_plus(
-        input_text,
-        return_tensors="pt",
-        truncation=True,
-        max_length=512
-    )
-    outputs = model.generate(
-        **encoding,
-        max_length=96,
-        do_sample=True,
-        top_p=0.9,
-        temperature=0.8,
-        num_return_sequences=1,
-        repetition_penalty=1.15,
-    )
-    text = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+
+def clean_rewrite(text: str) -> str:
+    text = text.strip()
     for marker in ["Instruction:", "Prompt:", "Return only"]:
         if marker in text:
             text = text.split(marker)[0].strip()
     return text
 
+def generate_with_model_batch(requests, batch_size=MUTATION_BATCH_SIZE, seed=MUTATION_SEED):
+    # requests: list of (base_prompt, instruction); returns rewrites in input order.
+    if backends.BACKEND == "stub":
+        return [clean_rewrite(backends.stub_rewrite(p, i, seed)) for p, i in requests]
+    import torch
+    tokenizer = get_tokenizer()
+    model = get_model()
+    torch.manual_seed(seed)
+    input_texts = [build_rewrite_input(p, i) for p, i in requests]
+    with span("mutation_tokenize", items=len(input_texts)) as sp:
+        encoded = tokenizer(input_texts, truncation=True, max_length=GENERATION_PARAMS["max_input_length"])["input_ids"]
+        sp.set(tokens=sum(map(len, encoded)))
+    order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+    outputs = [None] * len(encoded)
+    progress = Progress(len(order), "mutations")
+    for start in range(0, len(order), batch_size):
+        idxs = order[start:start + batch_size]
+        batch = tokenizer.pad({"input_ids": [encoded[i] for i in idxs]}, return_tensors="pt")
+        with span("mutation_generate", items=len(idxs)) as sp, torch.inference_mode(), backends.generation_context():
+            params = dict(
+                max_length=GENERATION_PARAMS["max_length"],
+                do_sample=True,
+                top_p=GENERATION_PARAMS["top_p"],
+                temperature=GENERATION_PARAMS["temperature"],
+                num_return_sequences=1,
+                repetition_penalty=GENERATION_PARAMS["repetition_penalty"],
+            )
+            if assisted.enabled():
+                lengths = batch["attention_mask"].sum(dim=1).tolist()
+                generated = [assisted.generate(model, batch["input_ids"][i:i + 1, :n], **params)[0]
+                             for i, n in enumerate(lengths)]
+            else:
+                generated = model.generate(**batch, **params)
+            sp.set(tokens=sum(int((row != tokenizer.pad_token_id).sum()) for row in generated))
+        with span("mutation_decode", items=len(idxs)):
+            decoded = tokenizer.batch_decode(generated, skip_special_tokens=True)
+        for i, text in zip(idxs, decoded):
+            outputs[i] = clean_rewrite(text)
+        progress.update(len(idxs))
+    progress.close()
+    return outputs
+
+def generate_with_model(base_prompt: str, instruction: str) -> str:
+    return generate_with_model_batch([(base_prompt, instruction)])[0]
+
+def _mutation_key(base_prompt, mutation_type, seed):
+    params = dict(GENERATION_PARAMS, mutation=mutation_type, seed=seed, backend=backends.BACKEND)
+    if assisted.enabled():
+        # Sampled rewrites depend on the draft model and lookahead as well as the seed.
+        params.update(assistant=assisted.DRAFT_MODEL, lookahead=assisted.LOOKAHEAD)
+    return make_key(PARAPHRASE_MODEL, params, MUTATION_GUIDELINES[mutation_type], base_prompt)
+
+def generate_mutations(requests, batch_size=MUTATION_BATCH_SIZE, seed=MUTATION_SEED):
+    # requests: list of (base_prompt, mutation_type). Rewrites are memoized per
+    # (parent text, mutation type, seed), so re-running or resuming a round does not re-generate;
+    # each round samples with its own seed, so a parent carried forward still gets fresh rewrites.
+    cache = get_cache()
+    results = [None] * len(requests)
+    keys = {}
+    for idx, (base_prompt, mutation_type) in enumerate(requests):
+        if mutation_type == "stepwise_prompt":
+            results[idx] = f"{base_prompt.strip()}{STEPWISE_SUFFIX}"
+        else:
+            keys[idx] = _mutation_key(base_prompt, mutation_type, seed)
+    found = cache.get_many(keys.values()) if cache is not None else {}
+
+    pending = {}
+    for idx, key in keys.items():
+        if key in found:
+            results[idx] = found[key]
+        elif key not in pending:
+            base_prompt, mutation_type = requests[idx]
+            pending[key] = (base_prompt, MUTATION_GUIDELINES[mutation_type])
+    if pending:
+        generated = generate_with_model_batch(list(pending.values()), batch_size=batch_size, seed=seed)
+        new_items = list(zip(pending.keys(), generated))
+        if cache is not None:
+            cache.put_many(new_items)
+        found.update(new_items)
+        for idx, key in keys.items():
+            results[idx] = found[key]
+    print(f"[mutations] {len(keys) - len(pending)}/{len(keys)} rewrites reused from cache")
+    return results
+
 def generate_new_prompt(base_prompt: str, mutation_type: str) -> str:
-    if mutation_type == "stepwise_prompt":
-        stepwise_suffix = (
-            " Always follow these steps: 1) Read the article, 2) Extract key facts, 3) Write a concise summary."
-        )
-        return f"{base_prompt.strip()}{stepwise_suffix}"
-    else:
-        instruction = MUTATION_GUIDELINES[mutation_type]
-        return generate_with_model(base_prompt, instruction)
-
-def generate_prompt_combinations(input_file: str, output_file: str):
+    return generate_mutations([(base_prompt, mutation_type)])[0]
+
+def generate_prompt_combinations(input_file: str, output_file: str, seed=None, round_idx=1, mutations=None):
+    # mutations: the mutation types to apply to every parent (all of them by default).
+    # The sampling seed defaults to one per round.
+    mutations = MUTATION_NAMES if mutations is None else mutations
+    seed = MUTATION_SEED + round_idx - 1 if seed is None else seed
     with open(input_file, "r", encoding="utf-8") as f:
         initial_prompts = json.load(f)
 
-    total = len(initial_prompts) * (1 + len(MUTATION_NAMES))
-    count = 0
-    all_candidates = []
+    requests = [(p["text"], mtype) for p in initial_prompts for mtype in mutations]
+    rewrites = iter(generate_mutations(requests, seed=seed))
 
-    for p in initial_prompts:
-        parent_name = p["name"]
-        parent_text = p["text"]
+    registry = PromptRegistry()
+    all_candidates = []
+    seen = set()
+    dropped = 0
 
+    def add(parent_name, mutation, text, parent_id=None):
+        nonlocal dropped
+        if not text.strip():
+            dropped += 1
+            return None
+        prompt_id = registry.register(text, parent_name, mutation, round_idx, parent_id)
+        if prompt_id in seen:
+            dropped += 1
+            return prompt_id
+        seen.add(prompt_id)
         all_candidates.append({
             "parent_name": parent_name,
-            "mutation": "none",
-            "prompt_text": parent_text
+            "mutation": mutation,
+            "prompt_text": text,
+            "prompt_id": prompt_id
         })
-        count += 1
-        print(f"[{count}/{total}] generated")
-
-        for mtype in MUTATION_NAMES:
-            new_prompt = generate_new_prompt(parent_text, mtype)
-            all_candidates.append({
-                "parent_name": parent_name,
-                "mutation": mtype,
-                "prompt_text": new_prompt
-            })
-            count += 1
-            print(f"[{count}/{total}] generated")
+        return prompt_id
+
+    for p in initial_prompts:
+        parent_id = add(p["name"], "none", p["text"])
+        for mtype in mutations:
+            add(p["name"], mtype, next(rewrites), parent_id)
 
     os.makedirs("results", exist_ok=True)
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(all_candidates, f, ensure_ascii=False, indent=2)
 
-    print(f"\nAll {len(all_candidates)} prompt candidates saved to {output_file}")
+    print(f"\nAll {len(all_candidates)} prompt candidates saved to {output_file} ({dropped} empty/duplicate dropped)")
 
 if __name__ == "__main__":
     generate_prompt_combinations("data/initial_prompts.json", "results/round_1_prompts.json")
@@ -0,0 +1,68 @@
+import json
+import subprocess
+import sys
+
+MODULES = [
+    "mutations",
+    "corpus",
+    "summary_cache",
+    "token_store",
+    "evaluation",
+    "pipeline",
+    "work_queue",
+    "backends",
+    "model_registry",
+    "assisted",
+    "llm_utils",
+    "long_doc",
+    "quality_gate",
+    "inference_server",
+    "generate_prompts",
+    "planner",
+    "evolution",
+    "baseline_generate",
+    "run_all",
+    "sample_extraction",
+    "visualize_results",
+]
+# Models are loaded on first use, so no module may pull torch in at import time.
+MAX_IMPORT_SECONDS = 5.0
+
+PROBE = (
+    "import json, sys, time\n"
+    "t = time.perf_counter()\n"
+    "import {module}\n"
+    "print(json.dumps({{'seconds': time.perf_counter() - t, 'torch': 'torch' in sys.modules}}))\n"
+)
+
+def measure(module):
+    proc = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"module": module, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["module"] = module
+    return result
+
+def main():
+    failures = []
+    for module in MODULES:
+        r = measure(module)
+        if "error" in r:
+            # A module that no longer imports is the worst regression of all.
+            print(f"{module:<20} import failed ({r['error']})  <-- error")
+            failures.append(module)
+            continue
+        flag = ""
+        if r["torch"]:
+            flag = "  <-- imports torch"
+            failures.append(module)
+        elif r["seconds"] > MAX_IMPORT_SECONDS:
+            flag = f"  <-- slower than {MAX_IMPORT_SECONDS:.1f}s"
+            failures.append(module)
+        print(f"{module:<20} {r['seconds']*1000:8.1f} ms  torch={r['torch']}{flag}")
+    if failures:
+        print(f"\nImport regressions: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
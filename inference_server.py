@@ -0,0 +1,166 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import assisted
+import backends
+import llm_utils
+from quality_gate import select_backend
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+WINDOW_MS = 10
+MAX_BATCH = llm_utils.BATCH_SIZE
+
+class Batcher:
+    # One thread owns the model. Requests from any number of clients are queued per
+    # item; the thread takes the oldest item, waits up to window_ms for more with the same
+    # max_length and generates them together as one micro-batch.
+    def __init__(self, window_ms=WINDOW_MS, max_batch=MAX_BATCH):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.started = time.time()
+        self.stats = {"requests": 0, "items": 0, "batches": 0, "busy_seconds": 0.0, "wait_seconds": 0.0,
+                      "max_queue_depth": 0}
+        self.batch_sizes = Counter()
+        self._lock = threading.Lock()
+        self._held = []
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, pairs, max_length):
+        futures = []
+        now = time.perf_counter()
+        for prompt, article in pairs:
+            future = Future()
+            self.queue.put((prompt, article, max_length, now, future))
+            futures.append(future)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["items"] += len(futures)
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue.qsize())
+        return futures
+
+    def _next(self, timeout=None):
+        if self._held:
+            return self._held.pop(0)
+        return self.queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next()
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        skipped = []
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._next(timeout=max(0.0, remaining)) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            (batch if item[2] == first[2] else skipped).append(item)
+        # Items for another max_length keep their place at the front of the line.
+        self._held = skipped + self._held
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            try:
+                summaries = llm_utils.query_t5_pairs([(p, a) for p, a, _, _, _ in batch], max_length=batch[0][2],
+                                                     batch_size=len(batch))
+            except Exception as e:
+                for item in batch:
+                    item[4].set_exception(e)
+                continue
+            for item, summary in zip(batch, summaries):
+                item[4].set_result(summary)
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["busy_seconds"] += time.perf_counter() - start
+                self.stats["wait_seconds"] += sum(start - item[3] for item in batch)
+                self.batch_sizes[len(batch)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            s = dict(self.stats)
+            sizes = dict(sorted(self.batch_sizes.items()))
+        done = sum(n * c for n, c in sizes.items())
+        uptime = time.time() - self.started
+        return dict(s, queue_depth=self.queue.qsize() + len(self._held), batch_sizes=sizes,
+                    mean_batch=done / s["batches"] if s["batches"] else 0.0,
+                    mean_wait_ms=s["wait_seconds"] / done * 1000 if done else 0.0,
+                    utilization=s["busy_seconds"] / uptime if uptime else 0.0,
+                    items_per_sec=done / uptime if uptime else 0.0, uptime_seconds=uptime)
+
+def server_info():
+    # Clients compare this with their own settings before routing generation here.
+    return {"model": llm_utils.MODEL_NAME, "backend": backends.BACKEND, "decode": llm_utils.decode_params(128),
+            "generation_params": llm_utils.GENERATION_PARAMS}
+
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, server_info())
+            elif self.path == "/stats":
+                self._send(200, batcher.snapshot())
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/summarize":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            futures = batcher.submit(request["pairs"], request.get("max_length", 128))
+            try:
+                self._send(200, {"summaries": [f.result() for f in futures]})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, window_ms=WINDOW_MS, max_batch=MAX_BATCH):
+    llm_utils.warm_up()
+    batcher = Batcher(window_ms, max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"[server] {llm_utils.MODEL_NAME} ({backends.BACKEND}) on http://{host}:{port}, "
+          f"window {window_ms} ms, max batch {max_batch}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[server] {json.dumps(batcher.snapshot())}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived summarization server with micro-batching")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--window-ms", type=float, default=WINDOW_MS, help="how long to wait for more requests")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND)
+    parser.add_argument("--assist", nargs="?", const=assisted.DEFAULT_DRAFT_MODEL, default=assisted.DRAFT_MODEL,
+                        metavar="DRAFT_MODEL")
+    parser.add_argument("--assist-lookahead", type=int, default=assisted.LOOKAHEAD)
+    args = parser.parse_args()
+    select_backend(args.backend)
+    assisted.configure(args.assist, args.assist_lookahead)
+    serve(args.host, args.port, args.window_ms, args.max_batch)
@@ -1,21 +1,341 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-import torch
+import json
+import multiprocessing
+import os
+import urllib.error
+import urllib.request
+from functools import lru_cache
+import assisted
+import backends
+from tracing import flush as flush_trace, span
+from model_registry import get_registry
+from summary_cache import get_cache, make_key
 
 MODEL_NAME = "google/flan-t5-base"
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+
+MAX_INPUT_LENGTH = 512
+BATCH_SIZE = 8
+SHARD_BATCHES = 4
+# Long prompts keep at least this many article tokens; anything beyond is cut from the prompt.
+MIN_ARTICLE_TOKENS = 64
+GENERATION_PARAMS = {"max_input_length": MAX_INPUT_LENGTH, "min_length": 30, "num_beams": 4, "early_stopping": True,
+                     "truncation": "prompt_first"}
+
+# A running inference_server.py with matching settings takes over generation (LLM_SERVER=0 disables).
+SERVER_URL = os.environ.get("LLM_SERVER_URL", "http://127.0.0.1:8765")
+SERVER_ENABLED = os.environ.get("LLM_SERVER", "1") != "0"
+SERVER_CHUNK = 32
+
+_tokenizer = None
+_server = None
+_token_store = None
+_truncation = {"inputs": 0, "articles_cut": 0, "article_tokens_dropped": 0, "prompts_cut": 0}
+
+# torch/transformers are imported on first use so that importing this module
+# (or anything that imports it) stays cheap.
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    return _tokenizer
+
+def get_model():
+    # One registry entry per backend, so quality_gate can hold fp32 and the candidate side by side.
+    backend = backends.BACKEND
+    return get_registry().get((MODEL_NAME, backend), lambda: backends.load_model(MODEL_NAME, backend))
+
+def unload_model(backend):
+    get_registry().evict((MODEL_NAME, backend))
+
+def warm_up():
+    query_t5("summarize: warm up", max_length=8)
+
+def decode_params(max_length):
+    if assisted.enabled():
+        # Assisted generation verifies draft tokens greedily; its output equals plain greedy decoding.
+        return {"max_length": max_length, "min_length": min(30, max_length), "num_beams": 1}
+    return {"max_length": max_length, "min_length": min(30, max_length), "num_beams": 4, "early_stopping": True}
+
+def _generate(model, batch, max_length):
+    # Returns one row of output IDs per input.
+    params = decode_params(max_length)
+    if not assisted.enabled():
+        return model.generate(**batch, **params)
+    lengths = batch["attention_mask"].sum(dim=1).tolist()
+    return [assisted.generate(model, batch["input_ids"][i:i + 1, :n], **params)[0] for i, n in enumerate(lengths)]
+
+def build_input(article: str, prompt: str) -> str:
+    return f"{prompt}\n\nArticle: {article}"
+
+def count_tokens(text: str) -> int:
+    if backends.BACKEND == "stub":
+        return backends.stub_count_tokens(text)
+    return len(get_tokenizer()(text)["input_ids"])
 
 def query_t5(input_text: str, max_length=128) -> str:
-    inputs = tokenizer(input_text, return_tensors="pt", truncation=True, max_length=512)
-    outputs = model.generate(
-        **inputs,
-        max_length=max_length,
-        min_length=30,
-        num_beams=4,
-        early_stopping=True
-    )
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+    if backends.BACKEND == "stub":
+        return backends.stub_summarize(input_text, max_length)
+    tokenizer = get_tokenizer()
+    model = get_model()
+    with span("tokenize", items=1) as sp:
+        inputs = tokenizer(input_text, return_tensors="pt", truncation=True, max_length=MAX_INPUT_LENGTH)
+        sp.set(tokens=int(inputs["input_ids"].numel()))
+    with span("generate", items=1) as sp, backends.generation_context():
+        outputs = _generate(model, inputs, max_length)
+        sp.set(tokens=int(outputs[0].numel()))
+    with span("decode", items=1):
+        return tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+def iter_query_t5_batch(input_texts, max_length=128, batch_size=BATCH_SIZE):
+    # Yields [(input_index, summary), ...] once per generated batch.
+    if backends.BACKEND == "stub":
+        for start in range(0, len(input_texts), batch_size):
+            idxs = range(start, min(start + batch_size, len(input_texts)))
+            with span("generate", items=len(idxs), backend="stub"):
+                done = [(i, backends.stub_summarize(input_texts[i], max_length)) for i in idxs]
+            yield done
+        return
+    with span("tokenize", items=len(input_texts)) as sp:
+        encoded = get_tokenizer()(list(input_texts), truncation=True, max_length=MAX_INPUT_LENGTH)["input_ids"]
+        sp.set(tokens=sum(map(len, encoded)))
+    yield from iter_generate_ids(encoded, max_length=max_length, batch_size=batch_size)
+
+def iter_generate_ids(encoded, max_length=128, batch_size=BATCH_SIZE):
+    # encoded: list of input ID lists; yields [(input_index, summary), ...] per batch.
+    import torch
+    tokenizer = get_tokenizer()
+    model = get_model()
+    # Sort by token length so each batch pads to its own longest member only.
+    order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+    for start in range(0, len(order), batch_size):
+        idxs = order[start:start + batch_size]
+        batch = tokenizer.pad({"input_ids": [encoded[i] for i in idxs]}, return_tensors="pt")
+        with span("generate", items=len(idxs), padded_len=int(batch["input_ids"].shape[1])) as sp, \
+                torch.inference_mode(), backends.generation_context():
+            generated = _generate(model, batch, max_length)
+            sp.set(tokens=sum(int((row != tokenizer.pad_token_id).sum()) for row in generated))
+        with span("decode", items=len(idxs)):
+            decoded = tokenizer.batch_decode(generated, skip_special_tokens=True)
+        yield list(zip(idxs, decoded))
+
+def query_t5_batch(input_texts, max_length=128, batch_size=BATCH_SIZE):
+    outputs = [None] * len(input_texts)
+    for done in iter_query_t5_batch(input_texts, max_length=max_length, batch_size=batch_size):
+        for i, text in done:
+            outputs[i] = text
+    return outputs
+
+def get_token_store():
+    global _token_store
+    if _token_store is None:
+        from token_store import TokenStore
+        tokenize = lambda texts: get_tokenizer()(texts, add_special_tokens=False)["input_ids"]
+        _token_store = TokenStore(MODEL_NAME, tokenize)
+    return _token_store
+
+@lru_cache(maxsize=4096)
+def _prefix_ids(prompt):
+    # Everything build_input puts before the article text.
+    return tuple(get_tokenizer()(f"{prompt}\n\nArticle:", add_special_tokens=False)["input_ids"])
+
+def encode_pairs(pairs):
+    # Prompt-first truncation: the prompt is kept whole and the article gets whatever is
+    # left of MAX_INPUT_LENGTH after it and the closing EOS. Articles come pre-tokenized
+    # from the token store, so only the (few, cached) prompts are tokenized here.
+    store = get_token_store()
+    eos = get_tokenizer().eos_token_id
+    max_prefix = MAX_INPUT_LENGTH - 1 - MIN_ARTICLE_TOKENS
+    with span("encode", items=len(pairs)) as sp:
+        with span("tokenize_articles"):
+            store.ensure(article for _, article in pairs)
+        encoded = []
+        for prompt, article in pairs:
+            prefix = _prefix_ids(prompt)
+            if len(prefix) > max_prefix:
+                prefix = prefix[:max_prefix]
+                _truncation["prompts_cut"] += 1
+            budget = MAX_INPUT_LENGTH - 1 - len(prefix)
+            article_ids = store.get(article)
+            if len(article_ids) > budget:
+                _truncation["articles_cut"] += 1
+                _truncation["article_tokens_dropped"] += len(article_ids) - budget
+            encoded.append(list(prefix) + article_ids[:budget].tolist() + [eos])
+        sp.set(tokens=sum(map(len, encoded)))
+    _truncation["inputs"] += len(pairs)
+    return encoded
+
+def iter_query_t5_pairs(pairs, max_length=128, batch_size=BATCH_SIZE):
+    # pairs: list of (prompt, article); yields [(pair_index, summary), ...] per batch.
+    if backends.BACKEND == "stub":
+        yield from iter_query_t5_batch([build_input(a, p) for p, a in pairs], max_length, batch_size)
+        return
+    yield from iter_generate_ids(encode_pairs(pairs), max_length=max_length, batch_size=batch_size)
+
+def query_t5_pairs(pairs, max_length=128, batch_size=BATCH_SIZE):
+    outputs = [None] * len(pairs)
+    for done in iter_query_t5_pairs(pairs, max_length=max_length, batch_size=batch_size):
+        for i, text in done:
+            outputs[i] = text
+    return outputs
+
+def cache_params(max_length):
+    params = dict(GENERATION_PARAMS, max_length=max_length, backend=backends.BACKEND)
+    if assisted.enabled():
+        # Keyed as greedy decoding: the draft model only changes speed, not the output.
+        params.update(num_beams=1, early_stopping=False)
+    return params
+
+def _cache_key(prompt, article, max_length):
+    return make_key(MODEL_NAME, cache_params(max_length), prompt, article)
 
 def summarize_with_prompt(article: str, prompt: str) -> str:
-    input_text = f"{prompt}\n\nArticle: {article}"
-    return query_t5(input_text, max_length=128)
+    return summarize_batch([(prompt, article)])[0]
+
+def _init_worker(num_threads):
+    if backends.BACKEND == "stub":
+        return
+    import torch
+    torch.set_num_threads(num_threads)
+    get_tokenizer()
+    get_model()
+
+def _generate_shard(args):
+    # inputs are texts for the stub backend and token ID lists otherwise.
+    shard_idx, inputs, max_length, batch_size = args
+    if backends.BACKEND == "stub":
+        batches = iter_query_t5_batch(inputs, max_length=max_length, batch_size=batch_size)
+    else:
+        batches = iter_generate_ids(inputs, max_length=max_length, batch_size=batch_size)
+    outputs = [None] * len(inputs)
+    for done in batches:
+        for i, text in done:
+            outputs[i] = text
+    # Worker spans only reach the trace file; the parent's round summary covers its own process.
+    flush_trace()
+    return shard_idx, outputs
+
+def server_url():
+    # Probed once per process; the server must run the same model, backend and decoding.
+    global _server
+    if _server is None:
+        _server = ""
+        if SERVER_ENABLED:
+            try:
+                with urllib.request.urlopen(SERVER_URL + "/health", timeout=0.5) as resp:
+                    info = json.load(resp)
+            except (OSError, ValueError):
+                info = None
+            expected = {"model": MODEL_NAME, "backend": backends.BACKEND, "decode": decode_params(128),
+                        "generation_params": GENERATION_PARAMS}
+            if info is not None:
+                if info == json.loads(json.dumps(expected)):
+                    _server = SERVER_URL
+                    print(f"[server] generating through {SERVER_URL}")
+                else:
+                    print(f"[server] {SERVER_URL} serves {info.get('model')} ({info.get('backend')}) with other "
+                          f"settings; generating locally")
+    return _server
+
+def _server_summarize(url, pairs, max_length):
+    body = json.dumps({"pairs": pairs, "max_length": max_length}, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(url + "/summarize", data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return json.load(resp)["summaries"]
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"Inference server error: {e.read().decode('utf-8', 'replace')}") from e
+
+def iter_generate(items, max_length=128, batch_size=BATCH_SIZE, workers=1):
+    # items: list of (key, (prompt, article)); yields lists of (key, summary) as batches/shards finish.
+    global _server
+    url = server_url()
+    if url:
+        # Small chunks so results still stream back for checkpointing; the server
+        # batches them together with other clients' requests.
+        for start in range(0, len(items), SERVER_CHUNK):
+            chunk = items[start:start + SERVER_CHUNK]
+            try:
+                with span("server_generate", items=len(chunk)):
+                    summaries = _server_summarize(url, [pair for _, pair in chunk], max_length)
+            except (urllib.error.URLError, ConnectionError) as e:
+                # Server stopped or restarted: probe again next time, finish this call locally.
+                _server = None
+                print(f"[server] {url} unreachable ({e}); generating the remaining {len(items) - start} items locally")
+                items = items[start:]
+                break
+            yield [(key, summary) for (key, _), summary in zip(chunk, summaries)]
+        else:
+            return
+    pairs = [pair for _, pair in items]
+    if workers <= 1:
+        for done in iter_query_t5_pairs(pairs, max_length=max_length, batch_size=batch_size):
+            yield [(items[i][0], summary) for i, summary in done]
+        return
+
+    # Inputs are encoded here, so truncation is counted once and workers only receive token IDs.
+    if backends.BACKEND == "stub":
+        inputs = [build_input(article, prompt) for prompt, article in pairs]
+    else:
+        inputs = encode_pairs(pairs)
+    # Contiguous shards of similar-length inputs keep padding low inside each worker.
+    order = sorted(range(len(items)), key=lambda i: len(inputs[i]))
+    shard_size = batch_size * SHARD_BATCHES
+    shards = [order[i:i + shard_size] for i in range(0, len(order), shard_size)]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        tasks = [(i, [inputs[j] for j in shard], max_length, batch_size) for i, shard in enumerate(shards)]
+        for shard_idx, generated in pool.imap_unordered(_generate_shard, tasks):
+            yield [(items[j][0], summary) for j, summary in zip(shards[shard_idx], generated)]
+
+def iter_summarize(pairs, batch_size=BATCH_SIZE, max_length=128, workers=1):
+    # pairs: iterable of (prompt, article); yields (input_index, summary) in completion
+    # order, cache hits first, so callers can checkpoint while generation runs.
+    pairs = list(pairs)
+    cache = get_cache()
+    keys = [_cache_key(prompt, article, max_length) for prompt, article in pairs]
+    with span("cache_read", items=len(keys)):
+        found = cache.get_many(keys) if cache is not None else {}
+    # Identical pairs inside one grid (carried-forward prompts) are generated once.
+    pending = {}
+    waiting = {}
+    for i, (key, (prompt, article)) in enumerate(zip(keys, pairs)):
+        if key in found:
+            yield i, found[key]
+            continue
+        if key not in pending:
+            pending[key] = (prompt, article)
+        waiting.setdefault(key, []).append(i)
+    if pending:
+        for new_items in iter_generate(list(pending.items()), max_length, batch_size, workers):
+            if cache is not None:
+                with span("cache_write", items=len(new_items)):
+                    cache.put_many(new_items)
+            for key, summary in new_items:
+                for i in waiting.pop(key):
+                    yield i, summary
+
+def summarize_batch(pairs, batch_size=BATCH_SIZE, max_length=128, workers=1):
+    # pairs: iterable of (prompt, article); results come back in input order.
+    pairs = list(pairs)
+    outputs = [None] * len(pairs)
+    for i, summary in iter_summarize(pairs, batch_size=batch_size, max_length=max_length, workers=workers):
+        outputs[i] = summary
+    return outputs
+
+def report_cache():
+    cache = get_cache()
+    if cache is not None:
+        cache.report()
+
+def report_truncation():
+    t = _truncation
+    if not t["inputs"]:
+        return
+    line = (f"[tokens] {t['inputs']} inputs encoded, {t['articles_cut']} articles cut to fit {MAX_INPUT_LENGTH} "
+            f"tokens ({t['article_tokens_dropped']} article tokens dropped)")
+    if t["prompts_cut"]:
+        line += f", {t['prompts_cut']} prompts cut to leave {MIN_ARTICLE_TOKENS} article tokens"
+    print(line)
+    for k in t:
+        t[k] = 0
@@ -0,0 +1,150 @@
+import argparse
+import json
+import backends
+import llm_utils
+from summary_cache import get_cache, make_key
+from tracing import span
+
+# Articles longer than one chunk are split into overlapping token windows, each window
+# is summarized with a fixed prompt (map), and the candidate prompt then summarizes the
+# joined chunk summaries instead of a truncated article (reduce).
+CHUNK_TOKENS = 400
+CHUNK_OVERLAP = 64
+MAP_PROMPT = "Summarize this part of a news article:"
+MAP_MAX_LENGTH = 96
+# Room left for the candidate prompt: joined summaries longer than the rest of the input
+# window are chunked and summarized again, up to MAX_LEVELS map passes in all.
+PROMPT_RESERVE = 160
+REDUCE_BUDGET = llm_utils.MAX_INPUT_LENGTH - 1 - PROMPT_RESERVE
+MAX_LEVELS = 4
+
+_stats = {"articles": 0, "chunked": 0, "chunks": 0, "cached": 0, "extra_levels": 0, "reduce_cut": 0}
+
+def _tokens(text):
+    if backends.BACKEND == "stub":
+        return text.split()
+    return llm_utils.get_tokenizer()(text, add_special_tokens=False)["input_ids"]
+
+def _windows(tokens):
+    # Token windows of CHUNK_TOKENS overlapping by CHUNK_OVERLAP (at least one).
+    if backends.BACKEND == "stub":
+        detok = " ".join
+    else:
+        detok = lambda ids: llm_utils.get_tokenizer().decode(list(map(int, ids)), skip_special_tokens=True)
+    step = CHUNK_TOKENS - CHUNK_OVERLAP
+    return [detok(tokens[start:start + CHUNK_TOKENS]) for start in range(0, max(1, len(tokens) - CHUNK_OVERLAP), step)]
+
+def chunk_article(article):
+    # Short articles stay one piece. With a model backend the article must already be in
+    # the token store (chunk_summaries adds all pending articles in one ensure call).
+    tokens = article.split() if backends.BACKEND == "stub" else llm_utils.get_token_store().get(article)
+    if len(tokens) <= CHUNK_TOKENS:
+        return [article]
+    return _windows(tokens)
+
+def _chunks_key(article):
+    params = dict(llm_utils.cache_params(MAP_MAX_LENGTH), chunk_tokens=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP,
+                  reduce_budget=REDUCE_BUDGET, max_levels=MAX_LEVELS)
+    return make_key(llm_utils.MODEL_NAME, params, MAP_PROMPT, article)
+
+def _map(pieces_by_article, batch_size, workers):
+    # One batched (and optionally multi-process) pass over the pieces of all articles.
+    pieces = []
+    owners = []
+    result = {}
+    for article, chunks in pieces_by_article.items():
+        result[article] = [None] * len(chunks)
+        for k, chunk in enumerate(chunks):
+            pieces.append((MAP_PROMPT, chunk))
+            owners.append((article, k))
+    with span("chunk_map", items=len(pieces)):
+        for i, summary in llm_utils.iter_summarize(pieces, batch_size=batch_size, max_length=MAP_MAX_LENGTH,
+                                                   workers=workers):
+            article, k = owners[i]
+            result[article][k] = summary
+    _stats["chunks"] += len(pieces)
+    return result
+
+def chunk_summaries(articles, batch_size=llm_utils.BATCH_SIZE, workers=1):
+    # {article: [chunk summary, ...]} (None for articles that fit in one chunk). The list is
+    # cached per article, so every candidate prompt and round reuses one map pass.
+    articles = list(dict.fromkeys(articles))
+    cache = get_cache()
+    keys = {article: _chunks_key(article) for article in articles}
+    with span("cache_read", items=len(keys)):
+        found = cache.get_many(keys.values()) if cache is not None else {}
+    result = {}
+    pending = []
+    for article in articles:
+        if keys[article] in found:
+            result[article] = json.loads(found[keys[article]])
+            _stats["cached"] += 1
+        else:
+            pending.append(article)
+    if pending and backends.BACKEND != "stub":
+        with span("tokenize_articles"):
+            llm_utils.get_token_store().ensure(pending)
+    to_map = {}
+    for article in pending:
+        chunks = chunk_article(article)
+        if len(chunks) == 1:
+            result[article] = None
+        else:
+            to_map[article] = chunks
+    level = 1
+    while to_map:
+        mapped = _map(to_map, batch_size, workers)
+        result.update(mapped)
+        # Joined summaries that would not fit next to the prompt are reduced again.
+        to_map = {}
+        if level < MAX_LEVELS:
+            for article, summaries in mapped.items():
+                tokens = _tokens(reduce_input(article, summaries))
+                if len(tokens) > REDUCE_BUDGET:
+                    to_map[article] = _windows(tokens)
+            _stats["extra_levels"] += len(to_map)
+        level += 1
+    for article in pending:
+        if result[article] is not None and len(_tokens(reduce_input(article, result[article]))) > REDUCE_BUDGET:
+            _stats["reduce_cut"] += 1
+    if cache is not None and pending:
+        with span("cache_write", items=len(pending)):
+            cache.put_many((keys[a], json.dumps(result[a], ensure_ascii=False)) for a in pending)
+    _stats["articles"] += len(articles)
+    _stats["chunked"] += sum(1 for a in pending if result[a] is not None)
+    return result
+
+def reduce_input(article, summaries):
+    # What the candidate prompt is applied to: the chunk summaries in article order.
+    return article if summaries is None else "\n".join(summaries)
+
+def condense(articles, batch_size=llm_utils.BATCH_SIZE, workers=1):
+    # {article: text to generate from}; scoring still uses the original article.
+    return {a: reduce_input(a, s) for a, s in chunk_summaries(articles, batch_size, workers).items()}
+
+def report():
+    s = _stats
+    if not s["articles"]:
+        return
+    line = (f"[long-doc] {s['articles']} articles, {s['cached']} from the chunk cache, {s['chunked']} newly split; "
+            f"{s['chunks']} chunks of {CHUNK_TOKENS} tokens (overlap {CHUNK_OVERLAP}) summarized, "
+            f"{s['extra_levels']} re-reduced to fit {REDUCE_BUDGET} tokens")
+    if s["reduce_cut"]:
+        line += f", {s['reduce_cut']} still over after {MAX_LEVELS} levels and cut"
+    print(line)
+    for k in s:
+        s[k] = 0
+
+if __name__ == "__main__":
+    from corpus import get_corpus
+    from quality_gate import select_backend
+    parser = argparse.ArgumentParser(description="Map step of long-document summarization for one article")
+    parser.add_argument("article_id")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND)
+    args = parser.parse_args()
+    select_backend(args.backend)
+    article = get_corpus().get(args.article_id)["article"]
+    summaries = chunk_summaries([article])[article]
+    for k, summary in enumerate(summaries or [article]):
+        print(f"--- chunk {k} ---\n{summary}")
+    report()
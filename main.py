@@ -1,4 +1,6 @@
-from data_utils import load_datasets
+import json
+import os
+from corpus import get_corpus
 from evolution import run_evolution
 
 INITIAL_PROMPTS = [
@@ -34,8 +36,11 @@ INITIAL_PROMPTS = [
     }
 ]
 
-DATASETS = ["cnn_dailymail", "EdinburghNLP/xsum"]
+PROMPT_FILE = os.path.join("results", "main_prompts.json")
 
 if __name__ == "__main__":
-    datasets = load_datasets(DATASETS, n_samples=2)
-    run_evolution(datasets, INITIAL_PROMPTS, max_rounds=5, top_k=5)
+    datasets = get_corpus().load(limit=2)
+    os.makedirs("results", exist_ok=True)
+    with open(PROMPT_FILE, "w", encoding="utf-8") as f:
+        json.dump(INITIAL_PROMPTS, f, ensure_ascii=False, indent=2)
+    run_evolution(datasets, PROMPT_FILE, top_k=5)
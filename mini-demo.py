@@ -1,34 +1,52 @@
-import os
-import json
 from llm_utils import query_t5
+from corpus import get_corpus
 from evaluation import evaluate_summary
+from model_registry import get_registry
+from summary_cache import get_cache, make_key
 
-DATA_DIR = "data"
+TUNED_MODEL_NAME = "mrm8488/t5-base-finetuned-summarize-news"
+TUNED_GENERATION_PARAMS = {"max_input_length": 512, "max_new_tokens": 128, "num_beams": 4, "early_stopping": True}
 
 def load_sample():
-    with open(os.path.join(DATA_DIR, "cnn_input.json"), "r", encoding="utf-8") as f:
-        cnn_data = json.load(f)
-    with open(os.path.join(DATA_DIR, "xsum_input.json"), "r", encoding="utf-8") as f:
-        xsum_data = json.load(f)
-    cnn_article, cnn_ref = cnn_data[0]["article"], cnn_data[0]["reference"]
-    xsum_article, xsum_ref = xsum_data[0]["article"], xsum_data[0]["reference"]
-    return ("cnn", cnn_article, cnn_ref), ("xsum", xsum_article, xsum_ref)
+    corpus = get_corpus()
+    cnn_item = corpus.head("cnn", 1)[0]
+    xsum_item = corpus.head("xsum", 1)[0]
+    return ("cnn", cnn_item["article"], cnn_item["reference"]), ("xsum", xsum_item["article"], xsum_item["reference"])
 
-def summarize_with_tuned_model(article, prompt):
-    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+_tuned_tokenizer = None
+
+def get_tuned_tokenizer():
+    global _tuned_tokenizer
+    if _tuned_tokenizer is None:
+        from transformers import AutoTokenizer
+        _tuned_tokenizer = AutoTokenizer.from_pretrained(TUNED_MODEL_NAME)
+    return _tuned_tokenizer
+
+def _load_tuned_model():
     import torch
+    from transformers import AutoModelForSeq2SeqLM
+    model = AutoModelForSeq2SeqLM.from_pretrained(TUNED_MODEL_NAME, low_cpu_mem_usage=True)
+    model.eval()
+    return model.to("cuda" if torch.cuda.is_available() else "cpu")
 
-    MODEL_NAME = "mrm8488/t5-base-finetuned-summarize-news"
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+def summarize_with_tuned_model(article, prompt):
+    cache = get_cache()
+    key = make_key(TUNED_MODEL_NAME, TUNED_GENERATION_PARAMS, prompt, article)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = model.to(device)
+    tokenizer = get_tuned_tokenizer()
+    model = get_registry().get((TUNED_MODEL_NAME, "eager"), _load_tuned_model)
+    device = model.device
 
     input_text = f"{prompt} {article}"
     inputs = tokenizer(input_text, return_tensors="pt", truncation=True, max_length=512).to(device)
     outputs = model.generate(**inputs, max_new_tokens=128, num_beams=4, early_stopping=True)
     summary = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    if cache is not None:
+        cache.put(key, summary)
     return summary
 
 def evaluate_prompt(prompt, article, reference):
@@ -53,5 +71,10 @@ def main():
             print(f"FRE: {scores['fre']:.2f}")
             print(f"Summary: {summary[:300]}...")
 
+    cache = get_cache()
+    if cache is not None:
+        cache.report()
+    get_registry().report()
+
 if __name__ == "__main__":
     main()
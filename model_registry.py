@@ -0,0 +1,129 @@
+import gc
+import os
+import resource
+import sys
+import time
+from collections import OrderedDict
+
+def _default_budget_mb():
+    # Half of physical memory unless MODEL_MEMORY_BUDGET_MB says otherwise (0 = no limit).
+    if "MODEL_MEMORY_BUDGET_MB" in os.environ:
+        return float(os.environ["MODEL_MEMORY_BUDGET_MB"])
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2 / 2**20
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+def _release_memory():
+    gc.collect()
+    # glibc keeps freed model weights in its arenas; hand them back so RSS actually drops.
+    if sys.platform.startswith("linux"):
+        try:
+            import ctypes
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+def checkpoint_mb(model_name):
+    # Size of the locally cached weights, used as the memory estimate before a first load.
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return 0
+    for filename in ["model.safetensors", "pytorch_model.bin"]:
+        path = try_to_load_from_cache(model_name, filename)
+        if isinstance(path, str) and os.path.exists(path):
+            return os.path.getsize(path) / 2**20
+    return 0
+
+class ModelRegistry:
+    # Process-wide cache of loaded models keyed by (model name, variant). Before a load,
+    # least-recently-used models are evicted until current RSS plus the expected size of
+    # the new model fits the budget.
+    def __init__(self, budget_mb=None):
+        self.budget_mb = _default_budget_mb() if budget_mb is None else budget_mb
+        self._models = OrderedDict()
+        self.stats = {}
+
+    def _stat(self, key):
+        return self.stats.setdefault(key, {"loads": 0, "load_seconds": 0.0, "mb": 0.0, "hits": 0, "evictions": 0})
+
+    def get(self, key, loader):
+        stat = self._stat(key)
+        if key in self._models:
+            self._models.move_to_end(key)
+            stat["hits"] += 1
+            return self._models[key]
+        # Unknown size: assume it is as large as the largest model seen so far.
+        expected = stat["mb"] or checkpoint_mb(key[0]) or max((s["mb"] for s in self.stats.values()), default=0)
+        self._make_room(expected)
+        before = current_rss_mb()
+        start = time.perf_counter()
+        model = loader()
+        seconds = time.perf_counter() - start
+        stat["loads"] += 1
+        stat["load_seconds"] += seconds
+        stat["mb"] = max(0.0, current_rss_mb() - before)
+        print(f"[models] loaded {self._label(key)} in {seconds:.1f}s, +{stat['mb']:.0f} MB "
+              f"(RSS {current_rss_mb():.0f} MB, budget {self._budget_label()})")
+        self._models[key] = model
+        self._make_room(0, keep=key)
+        return model
+
+    def _make_room(self, needed_mb, keep=None):
+        if not self.budget_mb:
+            return
+        while current_rss_mb() + needed_mb > self.budget_mb:
+            victim = next((k for k in self._models if k != keep), None)
+            if victim is None:
+                return
+            self.evict(victim)
+
+    def evict(self, key):
+        if self._models.pop(key, None) is None:
+            return
+        self._stat(key)["evictions"] += 1
+        _release_memory()
+        print(f"[models] evicted {self._label(key)} (RSS now {current_rss_mb():.0f} MB)")
+
+    def clear(self):
+        for key in list(self._models):
+            self.evict(key)
+
+    def _label(self, key):
+        return "/".join(str(part) for part in key)
+
+    def _budget_label(self):
+        return f"{self.budget_mb:.0f} MB" if self.budget_mb else "unlimited"
+
+    def report(self):
+        if not self.stats:
+            return
+        print(f"[models] peak RSS {peak_rss_mb():.0f} MB, budget {self._budget_label()}")
+        for key, s in self.stats.items():
+            print(f"  {self._label(key):<50} loads={s['loads']} load_time={s['load_seconds']:.1f}s "
+                  f"size={s['mb']:.0f}MB hits={s['hits']} evictions={s['evictions']}")
+
+_registry = None
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
+
+def set_budget(budget_mb):
+    get_registry().budget_mb = budget_mb
+    os.environ["MODEL_MEMORY_BUDGET_MB"] = str(budget_mb)
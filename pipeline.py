@@ -0,0 +1,87 @@
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from evaluation import evaluate_batch
+
+QUEUE_SIZE = 64
+SCORE_CHUNK = 16
+MAX_INFLIGHT_CHUNKS = 8
+
+_DONE = object()
+
+def _produce(source, q, errors):
+    try:
+        for item in source:
+            q.put(item)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        q.put(_DONE)
+
+class ScoringPipeline:
+    # Generation runs in a thread (torch releases the GIL), ROUGE/FRE scoring in a
+    # process pool, and the caller's loop is the writer. The queue and the number of
+    # in-flight scoring chunks are bounded, so a slow stage blocks the one before it
+    # instead of buffering results.
+    def __init__(self, scorers=2, queue_size=QUEUE_SIZE, chunk=SCORE_CHUNK, max_inflight=MAX_INFLIGHT_CHUNKS):
+        self.scorers = scorers
+        self.queue_size = queue_size
+        self.chunk = chunk
+        self.max_inflight = max_inflight
+        self._pool = None
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context("spawn")
+        self._pool = ProcessPoolExecutor(max_workers=self.scorers, mp_context=ctx)
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown(cancel_futures=True)
+        self._pool = None
+        return False
+
+    def run(self, results, lookup):
+        # results: iterable of (index, summary); lookup(index) -> (reference, article).
+        # Yields (index, summary, scores) in the order the generation stage produced them.
+        q = queue.Queue(maxsize=self.queue_size)
+        errors = []
+        producer = threading.Thread(target=_produce, args=(results, q, errors), daemon=True)
+        producer.start()
+        pending = deque()
+        batch = []
+
+        def submit():
+            refs, arts = zip(*(lookup(i) for i, _ in batch))
+            future = self._pool.submit(evaluate_batch, [s for _, s in batch], list(refs), list(arts))
+            pending.append((batch[:], future))
+            batch.clear()
+
+        def ready(block):
+            while pending and (block or pending[0][1].done()):
+                items, future = pending.popleft()
+                for (i, summary), scores in zip(items, future.result()):
+                    yield i, summary, scores
+                block = False
+
+        while True:
+            try:
+                item = q.get(timeout=0.05) if pending else q.get()
+            except queue.Empty:
+                yield from ready(False)
+                continue
+            if item is _DONE:
+                break
+            batch.append(item)
+            # Partial chunks go out as soon as generation has nothing more queued.
+            if len(batch) >= self.chunk or q.empty():
+                submit()
+            yield from ready(len(pending) >= self.max_inflight)
+        if batch:
+            submit()
+        while pending:
+            yield from ready(True)
+        producer.join()
+        if errors:
+            raise errors[0]
@@ -0,0 +1,161 @@
+import itertools
+import time
+import llm_utils
+import generate_prompts
+from evaluation import evaluate_summary, warm_up as warm_up_metrics
+from generate_prompts import MUTATION_NAMES, generate_with_model_batch
+from mutations import MUTATION_GUIDELINES
+
+CALIBRATION_SAMPLES = llm_utils.BATCH_SIZE
+# Fewer articles than this per dataset make the fitness too noisy to select on.
+MIN_ARTICLES = 5
+# Plans are made against this share of the remaining time, leaving room for model loads and writes.
+SAFETY = 0.9
+# stepwise_prompt is a fixed suffix, not a model call, so it is the first mutation kept.
+MUTATION_ORDER = ["stepwise_prompt"] + [m for m in MUTATION_NAMES if m != "stepwise_prompt"]
+
+def calibrate(datasets, prompts, samples=CALIBRATION_SAMPLES, batch_size=llm_utils.BATCH_SIZE):
+    # Seconds per uncached call of each stage, measured on a few real inputs after the
+    # models are loaded. Nothing is read from or written to the caches.
+    items = list(itertools.islice((item for group in zip(*datasets.values()) for item in group), samples))
+    llm_utils.warm_up()
+    generate_prompts.warm_up()
+    warm_up_metrics()
+    model_mutations = [m for m in MUTATION_ORDER if m != "stepwise_prompt"]
+    requests = [(prompts[i % len(prompts)], MUTATION_GUIDELINES[model_mutations[i % len(model_mutations)]])
+                for i in range(samples)]
+    start = time.perf_counter()
+    generate_with_model_batch(requests, batch_size=batch_size)
+    mutation = (time.perf_counter() - start) / len(requests)
+
+    pairs = [(prompts[i % len(prompts)], item["article"]) for i, item in enumerate(items)]
+    start = time.perf_counter()
+    summaries = llm_utils.query_t5_pairs(pairs, batch_size=batch_size)
+    summary = (time.perf_counter() - start) / len(pairs)
+
+    start = time.perf_counter()
+    for s, item in zip(summaries, items):
+        evaluate_summary(s, item["reference"], item["article"])
+    score = (time.perf_counter() - start) / len(items)
+    costs = {"mutation": mutation, "summary": summary, "score": score}
+    print(f"[planner] calibrated on {len(items)} inputs: mutation {mutation:.3f}s, summary {summary:.3f}s, "
+          f"score {score:.4f}s per call")
+    return costs
+
+def round_cost(costs, parents, n_mutations, n_articles):
+    # Predicted seconds per phase of one round: mutations for every parent, then the full grid.
+    calls = sum(1 for m in MUTATION_ORDER[:n_mutations] if m != "stepwise_prompt")
+    candidates = parents * (1 + n_mutations)
+    return {"mutation": parents * calls * costs["mutation"],
+            "evaluation": candidates * n_articles * (costs["summary"] + costs["score"])}
+
+class RoundPlanner:
+    # Chooses articles per dataset, mutations per parent (hence candidates) and rounds so
+    # that the remaining rounds fit before the deadline. More rounds win over more
+    # candidates, and more candidates over more articles. The article count is fixed by
+    # the first plan so fitness stays comparable across rounds; later plans only change
+    # candidates and rounds, with costs rescaled by what the last round actually took.
+    def __init__(self, budget_seconds, costs, article_counts, top_k, max_rounds, started=None):
+        self.budget = budget_seconds
+        self.deadline = (started or time.time()) + budget_seconds
+        self.costs = costs
+        self.article_counts = article_counts
+        self.top_k = top_k
+        self.max_rounds = max_rounds
+        self.scale = {"mutation": 1.0, "evaluation": 1.0}
+        self.articles = None
+
+    def _total_articles(self, per_dataset):
+        return sum(min(per_dataset, n) for n in self.article_counts.values())
+
+    def _predict(self, rounds, n_mutations, per_dataset, parents):
+        phases = {"mutation": 0.0, "evaluation": 0.0}
+        for _ in range(rounds):
+            cost = round_cost(self.costs, parents, n_mutations, self._total_articles(per_dataset))
+            for k in phases:
+                phases[k] += cost[k] * self.scale[k]
+            parents = self.top_k
+        return phases
+
+    def _fits(self, rounds, n_mutations, per_dataset, parents, available):
+        return sum(self._predict(rounds, n_mutations, per_dataset, parents).values()) <= available
+
+    def _most_articles(self, rounds, n_mutations, parents, available):
+        # Cost grows with the article count, so binary-search the largest count that fits.
+        lo, hi = MIN_ARTICLES, max(self.article_counts.values())
+        if not self._fits(rounds, n_mutations, lo, parents, available):
+            return None
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._fits(rounds, n_mutations, mid, parents, available):
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def plan(self, round_idx, parents):
+        # Returns the plan for this round (and the rounds after it), or None when not even
+        # the smallest round fits in the time left.
+        remaining = self.deadline - time.time()
+        available = remaining * SAFETY
+        choice = None
+        for rounds in range(self.max_rounds - round_idx + 1, 0, -1):
+            for n_mutations in range(len(MUTATION_ORDER), 0, -1):
+                if self.articles is None:
+                    per_dataset = self._most_articles(rounds, n_mutations, parents, available)
+                elif self._fits(rounds, n_mutations, self.articles, parents, available):
+                    per_dataset = self.articles
+                else:
+                    per_dataset = None
+                if per_dataset is not None:
+                    choice = (rounds, n_mutations, per_dataset)
+                    break
+            if choice:
+                break
+        if choice is None:
+            if self.articles is not None:
+                print(f"[planner] {remaining:.0f}s left is not enough for round {round_idx}; stopping")
+                return None
+            choice = (1, 1, MIN_ARTICLES)
+            print(f"[planner] budget of {self.budget:.0f}s is below the smallest plan; running one minimal round")
+        rounds, n_mutations, per_dataset = choice
+        self.articles = per_dataset
+        predicted = self._predict(1, n_mutations, per_dataset, parents)
+        plan = {
+            "round": round_idx,
+            "remaining_seconds": round(remaining, 1),
+            "articles_per_dataset": per_dataset,
+            "articles": self._total_articles(per_dataset),
+            "mutations": MUTATION_ORDER[:n_mutations],
+            "parents": parents,
+            "candidates": parents * (1 + n_mutations),
+            "rounds_left": rounds,
+            "predicted_seconds": predicted,
+            "predicted_total_seconds": round(sum(self._predict(rounds, n_mutations, per_dataset, parents).values()), 1),
+            "costs": dict(self.costs),
+            "scale": dict(self.scale),
+        }
+        print(f"[planner] round {round_idx}: {plan['articles']} articles × {plan['candidates']} candidates "
+              f"({n_mutations} mutations per parent), {rounds} round(s) planned in {remaining:.0f}s left; "
+              f"this round ~{sum(predicted.values()):.0f}s")
+        return plan
+
+    def observe(self, plan, mutation_seconds, evaluation_seconds, candidates, records):
+        # Rescale each phase by actual / unscaled prediction; a phase that did not run
+        # (reused prompt file) keeps its previous scale.
+        actual = {"mutation": mutation_seconds, "evaluation": evaluation_seconds}
+        for k, seconds in actual.items():
+            base = plan["predicted_seconds"][k] / plan["scale"][k] if plan["scale"][k] else 0
+            if seconds is not None and base > 0:
+                self.scale[k] = max(0.01, seconds / base)
+        outcome = {
+            "seconds": {k: None if v is None else round(v, 1) for k, v in actual.items()},
+            "total_seconds": round(sum(v or 0 for v in actual.values()), 1),
+            "candidates": candidates,
+            "records": records,
+            "remaining_seconds": round(self.deadline - time.time(), 1),
+            "scale": dict(self.scale),
+        }
+        print(f"[planner] round {plan['round']} took {outcome['total_seconds']:.0f}s "
+              f"(predicted {sum(plan['predicted_seconds'].values()):.0f}s), {outcome['remaining_seconds']:.0f}s left")
+        return outcome
@@ -0,0 +1,134 @@
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+import time
+
+REGISTRY_PATH = os.path.join("results", "prompt_registry.sqlite")
+METRICS = ["rouge1", "rougel", "fre", "compression"]
+
+def normalize_prompt(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+def article_set_id(datasets) -> str:
+    ids = sorted(f"{dataset_name}/{item['id']}" for dataset_name, samples in datasets.items() for item in samples)
+    return hashlib.sha256("\n".join(ids).encode("utf-8")).hexdigest()
+
+class PromptRegistry:
+    # Every normalized prompt text gets one stable integer ID; the first lineage
+    # (parent, mutation, round) that produced it is kept. Prompts persist across runs;
+    # evaluations belong to a run, so a fresh run scores its prompts again while a
+    # resumed one keeps skipping what it already scored.
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS prompts ("
+            "id INTEGER PRIMARY KEY, norm_text TEXT UNIQUE NOT NULL, text TEXT NOT NULL, "
+            "parent_id INTEGER, parent_name TEXT, mutation TEXT, round INTEGER)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL NOT NULL)")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(evaluations)")]
+        if columns and "run" not in columns:
+            # Evaluations from before runs existed cannot be attributed to one.
+            self.conn.execute("DROP TABLE evaluations")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS evaluations ("
+            "prompt_id INTEGER NOT NULL, run INTEGER NOT NULL, article_set TEXT NOT NULL, round INTEGER, "
+            "stats TEXT NOT NULL, PRIMARY KEY (prompt_id, run, article_set))"
+        )
+
+    def new_run(self):
+        return self.conn.execute("INSERT INTO runs (started) VALUES (?)", (time.time(),)).lastrowid
+
+    def last_run(self):
+        run_id = self.conn.execute("SELECT MAX(id) FROM runs").fetchone()[0]
+        return self.new_run() if run_id is None else run_id
+
+    def reset(self):
+        self.conn.execute("DELETE FROM evaluations")
+        self.conn.execute("DELETE FROM prompts")
+
+    def register(self, text, parent_name, mutation, round_idx, parent_id=None):
+        norm = normalize_prompt(text)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO prompts (norm_text, text, parent_id, parent_name, mutation, round) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (norm, text, parent_id, parent_name, mutation, round_idx)
+        )
+        return self.conn.execute("SELECT id FROM prompts WHERE norm_text=?", (norm,)).fetchone()[0]
+
+    def get(self, prompt_id):
+        row = self.conn.execute(
+            "SELECT id, text, parent_id, parent_name, mutation, round FROM prompts WHERE id=?", (prompt_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["id", "text", "parent_id", "parent_name", "mutation", "round"], row))
+
+    def lineage(self, prompt_id):
+        chain = []
+        while prompt_id is not None and len(chain) < 1000:
+            entry = self.get(prompt_id)
+            if entry is None:
+                break
+            chain.append(entry)
+            prompt_id = entry["parent_id"]
+        return chain
+
+    def evaluated(self, prompt_id, run_id, article_set):
+        row = self.conn.execute(
+            "SELECT stats FROM evaluations WHERE prompt_id=? AND run=? AND article_set=?",
+            (prompt_id, run_id, article_set)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_evaluation(self, prompt_id, run_id, article_set, round_idx, stats):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO evaluations (prompt_id, run, article_set, round, stats) VALUES (?, ?, ?, ?, ?)",
+            (prompt_id, run_id, article_set, round_idx, json.dumps(stats, ensure_ascii=False))
+        )
+
+class FitnessAggregator:
+    # Running per-prompt sums, so fitness is aggregated while records stream past.
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, record):
+        entry = self.entries.get(record["prompt_id"])
+        if entry is None:
+            entry = {
+                "prompt_id": record["prompt_id"],
+                "parent_name": record["parent_name"],
+                "mutation": record["mutation"],
+                "prompt_text": record["prompt_text"],
+                "n_articles": 0,
+                "sums": dict.fromkeys(METRICS, 0.0)
+            }
+            self.entries[record["prompt_id"]] = entry
+        entry["n_articles"] += 1
+        for m in METRICS:
+            entry["sums"][m] += record[m]
+
+    def stats(self):
+        for entry in self.entries.values():
+            stats = {k: v for k, v in entry.items() if k != "sums"}
+            for m in METRICS:
+                stats[m] = entry["sums"][m] / entry["n_articles"]
+            yield stats
+
+def top_k_prompts(stats_iter, k, rouge1_threshold):
+    # Bounded heap over per-prompt means; prompts already at the threshold are not carried forward.
+    heap = []
+    for seq, stats in enumerate(stats_iter):
+        if k <= 0 or stats["rouge1"] >= rouge1_threshold:
+            continue
+        entry = (stats["rouge1"], -seq, stats)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    return [s for _, _, s in sorted(heap, key=lambda e: (-e[0], -e[1]))]
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import time
+import backends
+import llm_utils
+from corpus import get_corpus
+from evaluation import evaluate_summary
+
+GATE_ARTICLES = 16
+GATE_PROMPT = "Summarize the following news article in a few sentences."
+# Largest allowed absolute change in mean ROUGE-1 / ROUGE-L versus eager fp32.
+ROUGE_TOLERANCE = 0.01
+VERDICT_PATH = os.path.join("cache", "backend_gate.json")
+
+def load_sample(n=GATE_ARTICLES):
+    # Fixed sample: the first n/2 articles of each dataset.
+    corpus = get_corpus()
+    return [item for name in ["cnn", "xsum"] for item in corpus.head(name, n // 2)]
+
+def score_backend(backend, sample, batch_size=llm_utils.BATCH_SIZE):
+    pairs = [(GATE_PROMPT, item["article"]) for item in sample]
+    with backends.using(backend):
+        llm_utils.get_model()
+        start = time.perf_counter()
+        summaries = llm_utils.query_t5_pairs(pairs, batch_size=batch_size)
+        seconds = time.perf_counter() - start
+    scores = [evaluate_summary(s, item["reference"], item["article"]) for s, item in zip(summaries, sample)]
+    return {
+        "rouge1": sum(s["rouge1"] for s in scores) / len(scores),
+        "rougel": sum(s["rougel"] for s in scores) / len(scores),
+        "seconds": seconds
+    }
+
+def _verdict_key(backend, tolerance, n):
+    return json.dumps([llm_utils.MODEL_NAME, backend, tolerance, n, GATE_PROMPT, llm_utils.decode_params(128)])
+
+def _load_verdicts():
+    if not os.path.exists(VERDICT_PATH):
+        return {}
+    with open(VERDICT_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def check_backend(backend, tolerance=ROUGE_TOLERANCE, n=GATE_ARTICLES, force=False):
+    # Verdicts are cached per (model, backend, tolerance, sample) so runs only pay for the check once.
+    verdicts = _load_verdicts()
+    key = _verdict_key(backend, tolerance, n)
+    if key in verdicts and not force:
+        return verdicts[key]
+    sample = load_sample(n)
+    print(f"[gate] scoring eager fp32 and {backend} on {len(sample)} articles ...")
+    reference = score_backend("eager", sample)
+    candidate = score_backend(backend, sample)
+    if backend != "eager":
+        llm_utils.unload_model("eager")
+    drift = max(abs(candidate["rouge1"] - reference["rouge1"]), abs(candidate["rougel"] - reference["rougel"]))
+    verdict = {
+        "backend": backend,
+        "fp32": reference,
+        "candidate": candidate,
+        "drift": drift,
+        "tolerance": tolerance,
+        "speedup": reference["seconds"] / max(candidate["seconds"], 1e-9),
+        "passed": drift <= tolerance
+    }
+    verdicts[key] = verdict
+    os.makedirs(os.path.dirname(VERDICT_PATH), exist_ok=True)
+    with open(VERDICT_PATH, "w", encoding="utf-8") as f:
+        json.dump(verdicts, f, indent=2)
+    return verdict
+
+def print_verdict(v):
+    status = "PASS" if v["passed"] else "FAIL"
+    print(f"[gate] {v['backend']}: {status} | R1 {v['candidate']['rouge1']:.4f} vs {v['fp32']['rouge1']:.4f} fp32, "
+          f"RL {v['candidate']['rougel']:.4f} vs {v['fp32']['rougel']:.4f} fp32, drift {v['drift']:.4f} "
+          f"(tolerance {v['tolerance']}), {v['speedup']:.2f}x generate speed")
+
+def select_backend(backend, tolerance=ROUGE_TOLERANCE, force=False):
+    # The gate scores the summarization model; the paraphrase model in
+    # generate_prompts runs on the same backend once it is accepted.
+    if backend in backends.OPTIMIZED_BACKENDS:
+        verdict = check_backend(backend, tolerance, force=force)
+        print_verdict(verdict)
+        if not verdict["passed"]:
+            raise RuntimeError(f"Backend {backend!r} changes ROUGE by {verdict['drift']:.4f} versus fp32 "
+                               f"(tolerance {tolerance}); refusing to use it")
+    backends.set_backend(backend)
+    print(f"Using LLM backend: {backend}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare optimized backends against eager fp32 on a fixed sample")
+    parser.add_argument("--backend", action="append", choices=backends.OPTIMIZED_BACKENDS,
+                        help="backend to check (repeatable; default: all optimized backends)")
+    parser.add_argument("--tolerance", type=float, default=ROUGE_TOLERANCE)
+    parser.add_argument("--articles", type=int, default=GATE_ARTICLES)
+    parser.add_argument("--force", action="store_true", help="ignore cached verdicts")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.backend or backends.OPTIMIZED_BACKENDS:
+        verdict = check_backend(name, args.tolerance, args.articles, force=args.force)
+        print_verdict(verdict)
+        failed |= not verdict["passed"]
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,311 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+
+RESULT_DIR = "results"
+STORE_PATH = os.path.join(RESULT_DIR, "results.sqlite")
+METRICS = ["rouge1", "rougel", "fre", "compression"]
+
+# Prompt texts and articles are interned once; per-record rows hold integer
+# references and typed metric columns. Each round is its own partition: writing
+# a round replaces that round's rows instead of appending to a log.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (id INTEGER PRIMARY KEY, text TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY, dataset TEXT NOT NULL, article_id TEXT NOT NULL, UNIQUE (dataset, article_id)
+);
+CREATE TABLE IF NOT EXISTS records (
+    round INTEGER NOT NULL, article INTEGER NOT NULL REFERENCES articles(id),
+    prompt INTEGER NOT NULL REFERENCES prompts(id), prompt_id INTEGER,
+    parent_name TEXT, mutation TEXT, summary TEXT,
+    rouge1 REAL, rougel REAL, fre REAL, compression REAL
+);
+CREATE INDEX IF NOT EXISTS idx_records_round ON records(round);
+CREATE INDEX IF NOT EXISTS idx_records_mutation ON records(mutation, round);
+CREATE TABLE IF NOT EXISTS meet (
+    meet_round INTEGER NOT NULL, round INTEGER, article INTEGER REFERENCES articles(id),
+    prompt INTEGER NOT NULL REFERENCES prompts(id), prompt_id INTEGER,
+    parent_name TEXT, mutation TEXT, summary TEXT,
+    rouge1 REAL, rougel REAL, fre REAL, compression REAL
+);
+CREATE INDEX IF NOT EXISTS idx_meet_round ON meet(meet_round);
+CREATE TABLE IF NOT EXISTS selected (
+    selected_round INTEGER NOT NULL, article INTEGER REFERENCES articles(id),
+    prompt INTEGER NOT NULL REFERENCES prompts(id), prompt_id INTEGER,
+    parent_name TEXT, mutation TEXT, n_articles INTEGER,
+    rouge1 REAL, rougel REAL, fre REAL, compression REAL
+);
+CREATE INDEX IF NOT EXISTS idx_selected_round ON selected(selected_round);
+CREATE TABLE IF NOT EXISTS baseline (
+    dataset TEXT NOT NULL, idx INTEGER NOT NULL, summary TEXT,
+    rouge1 REAL, rougel REAL, fre REAL, compression REAL, PRIMARY KEY (dataset, idx)
+);
+CREATE TABLE IF NOT EXISTS plans (round INTEGER PRIMARY KEY, planned TEXT NOT NULL, actual TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE VIEW IF NOT EXISTS records_view AS
+    SELECT r.round, a.dataset, a.article_id, r.prompt_id, r.parent_name, r.mutation, p.text AS prompt_text,
+           r.summary, r.rouge1, r.rougel, r.fre, r.compression
+    FROM records r JOIN articles a ON a.id = r.article JOIN prompts p ON p.id = r.prompt;
+CREATE VIEW IF NOT EXISTS meet_view AS
+    SELECT m.meet_round, m.round, a.dataset, a.article_id, m.prompt_id, m.parent_name, m.mutation,
+           p.text AS prompt_text, m.summary, m.rouge1, m.rougel, m.fre, m.compression
+    FROM meet m LEFT JOIN articles a ON a.id = m.article JOIN prompts p ON p.id = m.prompt;
+CREATE VIEW IF NOT EXISTS selected_view AS
+    SELECT s.selected_round, a.dataset, a.article_id, s.prompt_id, s.parent_name, s.mutation,
+           p.text AS prompt_text, s.n_articles, s.rouge1, s.rougel, s.fre, s.compression
+    FROM selected s LEFT JOIN articles a ON a.id = s.article JOIN prompts p ON p.id = s.prompt;
+"""
+
+class ResultsStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._prompt_ids = {}
+        self._article_ids = {}
+
+    def close(self):
+        self.conn.close()
+
+    def _prompt(self, text):
+        pid = self._prompt_ids.get(text)
+        if pid is None:
+            self.conn.execute("INSERT OR IGNORE INTO prompts (text) VALUES (?)", (text,))
+            pid = self.conn.execute("SELECT id FROM prompts WHERE text=?", (text,)).fetchone()[0]
+            self._prompt_ids[text] = pid
+        return pid
+
+    def _article(self, dataset, article_id):
+        if dataset is None or article_id is None:
+            return None
+        key = (dataset, article_id)
+        aid = self._article_ids.get(key)
+        if aid is None:
+            self.conn.execute("INSERT OR IGNORE INTO articles (dataset, article_id) VALUES (?, ?)", key)
+            aid = self.conn.execute("SELECT id FROM articles WHERE dataset=? AND article_id=?", key).fetchone()[0]
+            self._article_ids[key] = aid
+        return aid
+
+    def _row(self, r):
+        # Older result files call the parent prompt "prompt_name".
+        return (
+            self._article(r.get("dataset"), r.get("article_id")),
+            self._prompt(r["prompt_text"]),
+            r.get("prompt_id"),
+            r.get("parent_name", r.get("prompt_name")),
+            r.get("mutation"),
+        )
+
+    def write_round(self, round_idx, records):
+        # records may be a generator; rows are streamed into one transaction.
+        def rows():
+            for r in records:
+                yield (round_idx,) + self._row(r) + (r.get("summary"),) + tuple(r[m] for m in METRICS)
+        with self.conn:
+            self.conn.execute("DELETE FROM records WHERE round=?", (round_idx,))
+            self.conn.executemany(
+                "INSERT INTO records (round, article, prompt, prompt_id, parent_name, mutation, summary, "
+                "rouge1, rougel, fre, compression) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows()
+            )
+
+    def write_meet(self, meet_round, records):
+        def rows():
+            for r in records:
+                yield (meet_round, r.get("round")) + self._row(r) + (r.get("summary"),) + tuple(r[m] for m in METRICS)
+        with self.conn:
+            self.conn.execute("DELETE FROM meet WHERE meet_round=?", (meet_round,))
+            self.conn.executemany(
+                "INSERT INTO meet (meet_round, round, article, prompt, prompt_id, parent_name, mutation, summary, "
+                "rouge1, rougel, fre, compression) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows()
+            )
+
+    def write_selected(self, selected_round, records):
+        def rows():
+            for r in records:
+                yield (selected_round,) + self._row(r) + (r.get("n_articles"),) + tuple(r.get(m) for m in METRICS)
+        with self.conn:
+            self.conn.execute("DELETE FROM selected WHERE selected_round=?", (selected_round,))
+            self.conn.executemany(
+                "INSERT INTO selected (selected_round, article, prompt, prompt_id, parent_name, mutation, n_articles, "
+                "rouge1, rougel, fre, compression) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows()
+            )
+
+    def write_baseline(self, records):
+        with self.conn:
+            self.conn.execute("DELETE FROM baseline")
+            self.conn.executemany(
+                "INSERT INTO baseline (dataset, idx, summary, rouge1, rougel, fre, compression) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r["dataset"], r["index"], r.get("summary")) + tuple(r[m] for m in METRICS) for r in records]
+            )
+
+    def write_plan(self, round_idx, planned, actual=None):
+        # Budget planner output for a round (JSON), with what the round actually took.
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO plans (round, planned, actual) VALUES (?, ?, ?)",
+                (round_idx, json.dumps(planned, ensure_ascii=False),
+                 None if actual is None else json.dumps(actual, ensure_ascii=False))
+            )
+
+    def load_plans(self):
+        return [{"round": r, "planned": json.loads(p), "actual": json.loads(a) if a else None}
+                for r, p, a in self.conn.execute("SELECT round, planned, actual FROM plans ORDER BY round")]
+
+    def meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_empty(self, table):
+        return self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+
+    def round_size(self, round_idx):
+        return self.conn.execute("SELECT COUNT(*) FROM records WHERE round=?", (round_idx,)).fetchone()[0]
+
+    def has_round(self, round_idx):
+        return self.conn.execute("SELECT 1 FROM records WHERE round=? LIMIT 1", (round_idx,)).fetchone() is not None
+
+    def rounds(self):
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT round FROM records ORDER BY round")]
+
+    def iter_round(self, round_idx):
+        cur = self.conn.execute("SELECT * FROM records_view WHERE round=? ORDER BY rowid", (round_idx,))
+        cols = [c[0] for c in cur.description]
+        for row in cur:
+            yield dict(zip(cols, row))
+
+    def frame(self, sql, params=()):
+        import pandas as pd
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def load_records(self, rounds=None, mutation=None, dataset=None):
+        clauses, params = [], []
+        if rounds is not None:
+            rounds = list(rounds)
+            clauses.append(f"round IN ({','.join('?' * len(rounds))})")
+            params += rounds
+        if mutation is not None:
+            clauses.append("mutation=?")
+            params.append(mutation)
+        if dataset is not None:
+            clauses.append("dataset=?")
+            params.append(dataset)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.frame(f"SELECT * FROM records_view{where}", params)
+
+    def load_meet(self):
+        return self.frame("SELECT * FROM meet_view")
+
+    def load_selected(self):
+        return self.frame("SELECT * FROM selected_view")
+
+    def load_baseline(self):
+        return self.frame("SELECT dataset, idx AS \"index\", summary, rouge1, rougel, fre, compression FROM baseline")
+
+def _read_json_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if not text.strip():
+        return []
+    try:
+        data = json.loads(text)
+        records = data if isinstance(data, list) else [data]
+    except ValueError:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for d in records:
+        if isinstance(d.get("rouge"), dict):
+            d["rouge1"] = d["rouge"].get("rouge1")
+            d["rougel"] = d["rouge"].get("rougel")
+            d.pop("rouge", None)
+    return records
+
+def _group(records, field):
+    groups = {}
+    for r in records:
+        groups.setdefault(r.get(field), []).append(r)
+    return groups
+
+def import_json(result_dir=RESULT_DIR, store=None, only_empty=False):
+    # only_empty: leave every table that already has rows alone, e.g. a baseline written by
+    # baseline_generate before any round exists.
+    store = store or ResultsStore()
+    def wanted(table, path):
+        if not os.path.exists(path):
+            return False
+        if only_empty and not store.is_empty(table):
+            print(f"[import] {path} skipped: {table} already has rows")
+            return False
+        return True
+    round_paths = sorted(glob.glob(os.path.join(result_dir, "round_*_results.json")))
+    if round_paths and only_empty and not store.is_empty("records"):
+        print("[import] round_*_results.json skipped: records already has rows")
+        round_paths = []
+    for path in round_paths:
+        round_idx = int(re.search(r"round_(\d+)_results", path).group(1))
+        store.write_round(round_idx, _read_json_records(path))
+        print(f"[import] {path}")
+    meet_path = os.path.join(result_dir, "meet_threshold.json")
+    if wanted("meet", meet_path):
+        for meet_round, records in _group(_read_json_records(meet_path), "meet_round").items():
+            store.write_meet(meet_round, records)
+        print(f"[import] {meet_path}")
+    selected_path = os.path.join(result_dir, "selected_topk.json")
+    if wanted("selected", selected_path):
+        records = _read_json_records(selected_path)
+        for r in records:
+            r.setdefault("selected_round", r.get("round"))
+        for selected_round, group in _group(records, "selected_round").items():
+            store.write_selected(selected_round, group)
+        print(f"[import] {selected_path}")
+    baseline_path = os.path.join(result_dir, "baseline.json")
+    if wanted("baseline", baseline_path):
+        store.write_baseline(_read_json_records(baseline_path))
+        print(f"[import] {baseline_path}")
+    return store
+
+def import_legacy(result_dir=RESULT_DIR, store=None):
+    # First use of a store on a checkout with only the legacy JSON files imports them, once,
+    # and never over rows a pipeline script has already written.
+    store = store or ResultsStore()
+    if store.meta("legacy_imported") is None:
+        import_json(result_dir, store, only_empty=True)
+        store.set_meta("legacy_imported", "1")
+    return store
+
+def write_json_array(path, records):
+    # Same layout as json.dump(records, f, ensure_ascii=False, indent=2), one record at a time.
+    with open(path, "w", encoding="utf-8") as f:
+        first = True
+        for r in records:
+            f.write("[\n" if first else ",\n")
+            f.write("\n".join("  " + line for line in json.dumps(r, ensure_ascii=False, indent=2).split("\n")))
+            first = False
+        f.write("[]" if first else "\n]")
+
+def export_json(result_dir=RESULT_DIR, store=None):
+    store = store or ResultsStore()
+    for round_idx in store.rounds():
+        path = os.path.join(result_dir, f"round_{round_idx}_results.json")
+        write_json_array(path, store.iter_round(round_idx))
+        print(f"[export] {path}")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "import":
+        import_json()
+    elif command == "export":
+        export_json()
+    else:
+        print("usage: python results_store.py import|export")
@@ -1,7 +1,18 @@
-import os
+import argparse
+import contextlib
 import json
+import os
+import time
+import assisted
+import backends
+from corpus import get_corpus
 from generate_prompts import generate_prompt_combinations
 from evolution import run_evolution
+from model_registry import get_registry, set_budget
+from planner import RoundPlanner, calibrate
+from prompt_registry import PromptRegistry
+from quality_gate import select_backend
+from results_store import ResultsStore
 
 DATA_DIR = "data"
 RESULT_DIR = "results"
@@ -12,37 +23,102 @@ MAX_ROUNDS = 5
 TOP_K = 5
 ROUGE1_THRESHOLD = 0.5
 
-def run_all_rounds():
+def run_all_rounds(workers=1, resume=False, racing=False, pipeline=False, scorers=2, queue_dir=None, local_workers=0,
+                   long_docs=(), budget_seconds=None):
+    started = time.time()
     round_idx = 1
     input_file = os.path.join(DATA_DIR, "initial_prompts.json")
 
-    with open(os.path.join(DATA_DIR, "cnn_input.json"), "r", encoding="utf-8") as f:
-        cnn_data = json.load(f)
-    with open(os.path.join(DATA_DIR, "xsum_input.json"), "r", encoding="utf-8") as f:
-        xsum_data = json.load(f)
+    datasets = get_corpus().load()
+
+    # Prompts and their IDs persist; only evaluations from this run are skipped as already scored.
+    registry = PromptRegistry()
+    run_id = registry.last_run() if resume else registry.new_run()
 
-    datasets = {
-        "cnn": [{"id": i["id"], "article": i["article"], "reference": i["reference"]} for i in cnn_data],
-        "xsum": [{"id": i["id"], "article": i["article"], "reference": i["reference"]} for i in xsum_data]
-    }
+    planner = None
+    if budget_seconds:
+        with open(input_file, "r", encoding="utf-8") as f:
+            prompts = [p["text"] for p in json.load(f)]
+        planner = RoundPlanner(budget_seconds, calibrate(datasets, prompts),
+                               {name: len(samples) for name, samples in datasets.items()}, TOP_K, MAX_ROUNDS, started)
+    last_round = MAX_ROUNDS
 
-    while round_idx <= MAX_ROUNDS:
-        print(f"\n=== Round {round_idx} started ===")
-        output_prompt_file = os.path.join(RESULT_DIR, f"round_{round_idx}_prompts.json")
+    # One connection for the plan and resume bookkeeping; run_evolution writes the rounds.
+    with contextlib.closing(ResultsStore()) as store:
+        while round_idx <= last_round:
+            print(f"\n=== Round {round_idx} started ===")
+            output_prompt_file = os.path.join(RESULT_DIR, f"round_{round_idx}_prompts.json")
+            checkpoint_file = os.path.join(RESULT_DIR, f"round_{round_idx}_checkpoint.jsonl")
+            next_round_prompts = os.path.join(DATA_DIR, f"round_{round_idx+1}_prompts.json")
 
-        generate_prompt_combinations(input_file, output_prompt_file)
-        run_evolution(datasets, output_prompt_file, round_idx=round_idx, rouge1_threshold=ROUGE1_THRESHOLD, top_k=TOP_K)
+            if (resume and not os.path.exists(checkpoint_file) and os.path.exists(next_round_prompts)
+                    and store.has_round(round_idx)):
+                print(f"Round {round_idx} already completed, skipping")
+            else:
+                round_datasets, mutations = datasets, None
+                if planner:
+                    with open(input_file, "r", encoding="utf-8") as f:
+                        plan = planner.plan(round_idx, len(json.load(f)))
+                    if plan is None:
+                        break
+                    store.write_plan(round_idx, plan)
+                    round_datasets = {name: samples[:plan["articles_per_dataset"]] for name, samples in datasets.items()}
+                    mutations = plan["mutations"]
+                    last_round = round_idx + plan["rounds_left"] - 1
+                start = time.perf_counter()
+                mutation_seconds = None
+                # Candidates are sampled, so an interrupted round must reuse its prompt file.
+                if not (resume and os.path.exists(checkpoint_file) and os.path.exists(output_prompt_file)):
+                    generate_prompt_combinations(input_file, output_prompt_file, round_idx=round_idx, mutations=mutations)
+                    mutation_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                run_evolution(round_datasets, output_prompt_file, round_idx=round_idx, rouge1_threshold=ROUGE1_THRESHOLD,
+                              top_k=TOP_K, workers=workers, resume=resume, racing=racing, pipeline=pipeline, scorers=scorers,
+                              queue_dir=queue_dir, local_workers=local_workers, long_docs=long_docs, run_id=run_id)
+                if planner:
+                    with open(output_prompt_file, "r", encoding="utf-8") as f:
+                        candidates = len(json.load(f))
+                    outcome = planner.observe(plan, mutation_seconds, time.perf_counter() - start, candidates,
+                                              store.round_size(round_idx))
+                    store.write_plan(round_idx, plan, outcome)
 
-        next_round_prompts = os.path.join(DATA_DIR, f"round_{round_idx+1}_prompts.json")
-        if not os.path.exists(next_round_prompts):
-            print(f"Evolution finished early at round {round_idx}")
-            break
+            if not os.path.exists(next_round_prompts):
+                print(f"Evolution finished early at round {round_idx}")
+                break
 
-        input_file = next_round_prompts
-        round_idx += 1
+            input_file = next_round_prompts
+            round_idx += 1
 
     print("\nAll rounds completed.")
     print(f"Results saved in: {RESULT_DIR}")
+    get_registry().report()
 
 if __name__ == "__main__":
-    run_all_rounds()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="number of generation processes")
+    parser.add_argument("--resume", action="store_true", help="skip completed rounds and continue from checkpoints")
+    parser.add_argument("--racing", action="store_true", help="prune candidates early on an article subset")
+    parser.add_argument("--pipeline", action="store_true", help="overlap generation, scoring and writing")
+    parser.add_argument("--scorers", type=int, default=2, help="scoring processes in --pipeline mode")
+    parser.add_argument("--queue", default=None, metavar="DIR",
+                        help="shared work directory; rounds are generated and scored by work_queue.py workers")
+    parser.add_argument("--local-workers", type=int, default=0, help="worker processes to start on this host with --queue")
+    parser.add_argument("--long-doc", action="append", default=[], metavar="DATASET",
+                        help="summarize this dataset's long articles chunk by chunk, then reduce (repeatable)")
+    parser.add_argument("--budget-minutes", type=float, default=None,
+                        help="wall-clock budget; articles, candidates and rounds are planned to fit it")
+    parser.add_argument("--model-budget-mb", type=float, default=None,
+                        help="RSS budget for resident models; LRU models are evicted to stay under it (0 = no limit)")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND,
+                        help="LLM backend; optimized ones must pass the fp32 quality gate")
+    parser.add_argument("--assist", nargs="?", const=assisted.DEFAULT_DRAFT_MODEL, default=assisted.DRAFT_MODEL,
+                        metavar="DRAFT_MODEL", help="assisted decoding with a draft model (default flan-t5-small)")
+    parser.add_argument("--assist-lookahead", type=int, default=assisted.LOOKAHEAD, help="draft tokens per step")
+    args = parser.parse_args()
+    if args.model_budget_mb is not None:
+        set_budget(args.model_budget_mb)
+    select_backend(args.backend)
+    assisted.configure(args.assist, args.assist_lookahead)
+    run_all_rounds(workers=args.workers, resume=args.resume, racing=args.racing, pipeline=args.pipeline,
+                   scorers=args.scorers, queue_dir=args.queue, local_workers=args.local_workers,
+                   long_docs=args.long_doc, budget_seconds=args.budget_minutes * 60 if args.budget_minutes else None)
@@ -1,52 +1,133 @@
-import os, json, random
-from datasets import load_dataset
+import argparse
+import bisect
+import os, random
+from array import array
+from corpus import CORPUS_DIR, CorpusWriter
 
-OUT_DIR = "data"
-os.makedirs(OUT_DIR, exist_ok=True)
+# Keep `datasets` from pulling in torch/tf/jax: sampling only needs Arrow.
+os.environ.setdefault("USE_TORCH", "0")
+os.environ.setdefault("USE_TF", "0")
+os.environ.setdefault("USE_JAX", "0")
 
-def sample_and_save(dataset_name, split, k, out_path, article_key, summary_key, prefix):
-    print(f"[loading] {dataset_name}")
+SAMPLE_SEED = 0
+LENGTH_BATCH = 10000
 
+def load_split(dataset_name, split, streaming=False):
+    from datasets import load_dataset
     if dataset_name == "cnn_dailymail":
-        ds = load_dataset(dataset_name, "3.0.0", split=split)
-    else:
-        ds = load_dataset(dataset_name, split=split)
+        return load_dataset(dataset_name, "3.0.0", split=split, streaming=streaming)
+    return load_dataset(dataset_name, split=split, streaming=streaming)
+
+def word_lengths(ds, article_key):
+    # Word counts computed on Arrow batches of the cached split; only one int per row is kept.
+    import pyarrow.compute as pc
+    lengths = array("I")
+    for batch in ds.select_columns([article_key]).with_format("arrow").iter(batch_size=LENGTH_BATCH):
+        lengths.extend(pc.list_value_length(pc.utf8_split_whitespace(batch[article_key])).to_pylist())
+    return lengths
+
+def length_edges(lengths, buckets):
+    # Quantile edges, so every length bucket holds about the same share of the split.
+    ordered = sorted(lengths)
+    return [ordered[len(ordered) * b // buckets] for b in range(1, buckets)]
+
+def bucket_quotas(k, buckets):
+    return [k // buckets + (1 if b < k % buckets else 0) for b in range(buckets)]
 
-    items = random.sample(list(ds), k)
+def reservoir_sample(items, quotas, bucket, rng):
+    # Algorithm R per stratum: one pass, at most sum(quotas) items held at any time.
+    reservoirs = [[] for _ in quotas]
+    seen = [0] * len(quotas)
+    for item in items:
+        b = bucket(item)
+        seen[b] += 1
+        if len(reservoirs[b]) < quotas[b]:
+            reservoirs[b].append(item)
+        else:
+            j = rng.randrange(seen[b])
+            if j < quotas[b]:
+                reservoirs[b][j] = item
+    return reservoirs, seen
 
-    records = []
-    for i, s in enumerate(items, start=1):
-        records.append({
-            "id": f"{prefix}_{i:02}", 
-            "article": s[article_key],
-            "reference": s[summary_key]
-        })
+def _describe(edges, reservoirs, seen):
+    bounds = [0] + edges
+    parts = []
+    for b, (kept, total) in enumerate(zip(reservoirs, seen)):
+        span = f"{bounds[b]}-{edges[b] - 1}" if b < len(edges) else f"{bounds[b]}+"
+        parts.append(f"{span} words: {len(kept)}/{total}")
+    return ", ".join(parts)
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(records, f, indent=2, ensure_ascii=False)
+def sample_and_save(dataset_name, split, k, name, article_key, summary_key, prefix, seed=SAMPLE_SEED,
+                    buckets=1, edges=None, streaming=False):
+    print(f"[loading] {dataset_name}")
+    rng = random.Random(seed)
+    edges = list(edges or [])
+
+    if streaming:
+        # Remote/streamed split: no random access, so reservoir-sample rows in one pass.
+        if buckets > 1 and not edges:
+            raise ValueError("Stratified sampling of a streamed split needs explicit --length-edges")
+        ds = load_split(dataset_name, split, streaming=True)
+        quotas = bucket_quotas(k, len(edges) + 1)
+        reservoirs, seen = reservoir_sample(
+            ds, quotas, lambda row: bisect.bisect_right(edges, len(row[article_key].split())), rng)
+        rows = [row for r in reservoirs for row in r]
+    else:
+        # Cached Arrow split: draw row indices, then read only those rows.
+        ds = load_split(dataset_name, split)
+        lengths = None
+        if buckets > 1 or edges:
+            lengths = word_lengths(ds, article_key)
+            edges = edges or length_edges(lengths, buckets)
+        quotas = bucket_quotas(k, len(edges) + 1)
+        bucket = (lambda i: bisect.bisect_right(edges, lengths[i])) if edges else (lambda i: 0)
+        reservoirs, seen = reservoir_sample(range(len(ds)), quotas, bucket, rng)
+        rows = ds.select(sorted(i for r in reservoirs for i in r))
 
-    print(f"[saved] {out_path} ({len(records)} samples)")
+    # Rows are streamed into the corpus shards; only the sampled indices/rows are held.
+    with CorpusWriter(name) as writer:
+        for i, s in enumerate(rows, start=1):
+            writer.add({
+                "id": f"{prefix}_{i:02}",
+                "article": s[article_key],
+                "reference": s[summary_key]
+            })
+
+    print(f"[sampled] seed={seed} {_describe(edges, reservoirs, seen)}")
+    if writer.count < k:
+        print(f"[warning] only {writer.count} of {k} requested rows available")
+    print(f"[saved] {os.path.join(CORPUS_DIR, name)} ({writer.count} samples)")
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=20, help="articles per dataset")
+    parser.add_argument("--seed", type=int, default=SAMPLE_SEED)
+    parser.add_argument("--buckets", type=int, default=1, help="length strata (quantiles of article word count)")
+    parser.add_argument("--length-edges", type=lambda s: [int(x) for x in s.split(",")], default=None,
+                        help="explicit word-count bucket edges, e.g. 300,600,900 (required with --streaming)")
+    parser.add_argument("--streaming", action="store_true", help="reservoir-sample a streamed split instead")
+    args = parser.parse_args()
+    options = dict(k=args.k, seed=args.seed, buckets=args.buckets, edges=args.length_edges, streaming=args.streaming)
+
     sample_and_save(
         dataset_name="cnn_dailymail",
         split="test",
-        k=20,
-        out_path=os.path.join(OUT_DIR, "cnn_input.json"),
+        name="cnn",
         article_key="article",
         summary_key="highlights",
-        prefix="cnn"
+        prefix="cnn",
+        **options
     )
 
     sample_and_save(
         dataset_name="EdinburghNLP/xsum",
         split="test",
-        k=20,
-        out_path=os.path.join(OUT_DIR, "xsum_input.json"),
+        name="xsum",
         article_key="document",
         summary_key="summary",
-        prefix="xsum"
+        prefix="xsum",
+        **options
     )
 
 if __name__ == "__main__":
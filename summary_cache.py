@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+CACHE_DIR = "cache"
+CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", os.path.join(CACHE_DIR, "summaries.sqlite"))
+MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 200000))
+ENABLED = os.environ.get("SUMMARY_CACHE", "1") != "0"
+
+def article_hash(article: str) -> str:
+    return hashlib.sha256(article.encode("utf-8")).hexdigest()
+
+def make_key(model_name, params, prompt, article) -> str:
+    payload = json.dumps([model_name, params, prompt, article_hash(article)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SummaryCache:
+    # SQLite in WAL mode lets several processes (run_all, baseline, mini-demo)
+    # read and write the same file; last_access drives LRU eviction.
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Not shared concurrently: the pipelined mode hands the cache to the generation
+            # thread and only reads it from the main thread after that thread has finished.
+            self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, summary TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON summaries(last_access)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        if not keys:
+            return found
+        conn = self._connect()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, summary in conn.execute(f"SELECT key, summary FROM summaries WHERE key IN ({marks})", chunk):
+                found[key] = summary
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE summaries SET last_access=? WHERE key=?", [(now, k) for k in found])
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        items = list(items)
+        if not items:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO summaries (key, summary, last_access) VALUES (?, ?, ?)",
+                [(key, summary, now) for key, summary in items]
+            )
+            count = conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM summaries WHERE key IN "
+                    "(SELECT key FROM summaries ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put(self, key, summary):
+        self.put_many([(key, summary)])
+
+    def size(self):
+        return self._connect().execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self.size()
+        }
+
+    def report(self, label="summary cache"):
+        s = self.stats()
+        print(f"[{label}] hits={s['hits']} misses={s['misses']} hit_rate={s['hit_rate']:.1%} entries={s['entries']}")
+
+_default_cache = None
+
+def get_cache():
+    global _default_cache
+    if not ENABLED:
+        return None
+    if _default_cache is None:
+        _default_cache = SummaryCache()
+    return _default_cache
@@ -0,0 +1,75 @@
+import fcntl
+import json
+import os
+import numpy as np
+from summary_cache import CACHE_DIR, article_hash
+
+TOKEN_DIR = os.path.join(CACHE_DIR, "tokens")
+
+class TokenStore:
+    # Article token IDs (no special tokens) concatenated in one uint32 file and
+    # memory-mapped read-only; index.json maps article hash -> [offset, length].
+    # Several processes may append at once (local workers, concurrent scripts), so
+    # ensure() runs under an exclusive lock and readers reload on a miss.
+    def __init__(self, model_name, tokenize, root=TOKEN_DIR):
+        self.dir = os.path.join(root, model_name.replace("/", "--"))
+        self.ids_path = os.path.join(self.dir, "ids.bin")
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.lock_path = os.path.join(self.dir, "lock")
+        self.tokenize = tokenize
+        self.index = {}
+        self._load_index()
+        self._ids = None
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def ensure(self, articles, batch_size=64):
+        missing = {}
+        for article in articles:
+            key = article_hash(article)
+            if key not in self.index:
+                missing[key] = article
+        if not missing:
+            return 0
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another writer may have appended since we last looked.
+            self._load_index()
+            items = [(key, article) for key, article in missing.items() if key not in self.index]
+            if items:
+                with open(self.ids_path, "ab") as f:
+                    f.seek(0, 2)
+                    offset = f.tell() // 4
+                    for start in range(0, len(items), batch_size):
+                        chunk = items[start:start + batch_size]
+                        for (key, _), ids in zip(chunk, self.tokenize([a for _, a in chunk])):
+                            np.asarray(ids, dtype=np.uint32).tofile(f)
+                            self.index[key] = [offset, len(ids)]
+                            offset += len(ids)
+                tmp = self.index_path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.index, f)
+                os.replace(tmp, self.index_path)
+                self._ids = None
+        return len(items)
+
+    def _map(self):
+        if self._ids is None:
+            self._ids = np.memmap(self.ids_path, dtype=np.uint32, mode="r")
+        return self._ids
+
+    def get(self, article):
+        key = article_hash(article)
+        if key not in self.index:
+            self._load_index()
+        offset, length = self.index[key]
+        if length == 0:
+            return np.empty(0, dtype=np.uint32)
+        if self._ids is not None and offset + length > len(self._ids):
+            # Appended by another process after this mapping was made.
+            self._ids = None
+        return self._map()[offset:offset + length]
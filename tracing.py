@@ -0,0 +1,135 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+# TRACE=0 turns spans into no-ops; the progress line is always shown.
+ENABLED = os.environ.get("TRACE", "1") != "0"
+TRACE_PATH = os.environ.get("TRACE_PATH", os.path.join("results", "trace.jsonl"))
+FLUSH_EVERY = 256
+
+_events = []
+_totals = {}
+# Spans are recorded from the pipeline's generation thread as well as the main thread.
+_lock = threading.Lock()
+
+class _Span:
+    __slots__ = ("name", "attrs", "start")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        event = dict(self.attrs, span=self.name, ts=time.time(), ms=duration * 1000, pid=os.getpid())
+        with _lock:
+            total = _totals.get(self.name)
+            if total is None:
+                total = _totals[self.name] = {"count": 0, "seconds": 0.0, "tokens": 0}
+            total["count"] += 1
+            total["seconds"] += duration
+            total["tokens"] += self.attrs.get("tokens", 0)
+            _events.append(event)
+            full = len(_events) >= FLUSH_EVERY
+        if full:
+            flush()
+        return False
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullSpan()
+
+def span(name, **attrs):
+    return _Span(name, attrs) if ENABLED else _NULL
+
+def flush():
+    with _lock:
+        if not _events:
+            return
+        os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+        with open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in _events))
+        _events.clear()
+
+atexit.register(flush)
+
+def summary(reset=True):
+    with _lock:
+        result = {name: dict(t) for name, t in _totals.items()}
+        if reset:
+            _totals.clear()
+    return result
+
+def report(label):
+    if not ENABLED:
+        return
+    flush()
+    stats = summary()
+    if not stats:
+        return
+    wall = sum(t["seconds"] for t in stats.values())
+    print(f"\n[{label}] time by stage (this process; full trace in {TRACE_PATH})")
+    print(f"  {'span':<20}{'calls':>8}{'total s':>10}{'mean ms':>10}{'share':>8}{'tokens':>10}{'tok/s':>10}")
+    for name, t in sorted(stats.items(), key=lambda kv: -kv[1]["seconds"]):
+        tok_s = f"{t['tokens'] / t['seconds']:10.1f}" if t["tokens"] and t["seconds"] else f"{'-':>10}"
+        print(f"  {name:<20}{t['count']:>8}{t['seconds']:>10.2f}{t['seconds'] / t['count'] * 1000:>10.1f}"
+              f"{t['seconds'] / wall if wall else 0:>8.1%}{t['tokens'] or '-':>10}{tok_s}")
+
+def _fmt_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+class Progress:
+    # Single rewritten status line on a terminal; a plain line every few seconds in logs.
+    def __init__(self, total, label, interval=None):
+        self.total = total
+        self.label = label
+        self.count = 0
+        self.start = time.perf_counter()
+        self.tty = sys.stdout.isatty()
+        self.interval = interval if interval is not None else (0.5 if self.tty else 10.0)
+        self.last = 0.0
+
+    def update(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if now - self.last >= self.interval or self.count >= self.total:
+            self.last = now
+            self._print(now)
+
+    def _print(self, now):
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.count / elapsed
+        eta = (self.total - self.count) / rate if rate else 0
+        pct = self.count / self.total if self.total else 1.0
+        line = f"[{self.label}] {self.count}/{self.total} ({pct:.1%}) {rate:.2f} it/s ETA {_fmt_eta(eta)}"
+        if self.tty:
+            sys.stdout.write("\r" + line)
+            sys.stdout.flush()
+        else:
+            print(line, flush=True)
+
+    def close(self):
+        if self.tty and self.count:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
@@ -1,12 +1,20 @@
-import os
+import argparse
+import hashlib
+import inspect
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+from results_store import ResultsStore, import_legacy
 
 RESULT_DIR = "results"
 PIC_DIR = os.path.join(RESULT_DIR, "pic")
+MANIFEST_PATH = os.path.join(PIC_DIR, "manifest.json")
 os.makedirs(PIC_DIR, exist_ok=True)
 
 MUT_ABBR = {
@@ -21,40 +29,61 @@ MUT_ABBR = {
 def shorten_mutation(name: str) -> str:
     return MUT_ABBR.get(name, name)
 
-def load_and_flatten(path):
-    if not os.path.exists(path):
-        return pd.DataFrame()
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    for d in data:
-        if isinstance(d.get("rouge"), dict):
-            d["rouge1"] = d["rouge"].get("rouge1")
-            d["rougel"] = d["rouge"].get("rougel")
-            d.pop("rouge", None)
-    return pd.DataFrame(data)
-
-def plot_rounds():
-    files = [f for f in os.listdir(RESULT_DIR) if f.startswith("round_") and f.endswith("_results.json")]
-    for f in sorted(files):
-        path = os.path.join(RESULT_DIR, f)
-        df = load_and_flatten(path)
-        if df.empty or "rouge1" not in df.columns or "parent_name" not in df.columns:
-            continue
-        df["mutation_short"] = df["mutation"].apply(shorten_mutation)
-        plt.figure(figsize=(10,6))
-        sns.barplot(data=df, x="parent_name", y="rouge1", hue="mutation_short", errorbar=None)
-        plt.xticks(rotation=0)
-        plt.title(f"{f} — rouge1 by prompt & mutation (mean)")
-        plt.savefig(os.path.join(PIC_DIR, f.replace(".json","_bar.png")))
-        plt.close()
-
-def plot_threshold_trend():
-    path = os.path.join(RESULT_DIR,"meet_threshold.json")
-    if not os.path.exists(path): 
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = import_legacy(RESULT_DIR, ResultsStore())
+    return _store
+
+METRIC_COLUMNS = ["rouge1", "rougel", "fre", "compression"]
+ROUND_COLUMNS = ["round", "meet_round", "selected_round"]
+
+def _typed(df):
+    for col in METRIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    for col in ROUND_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+    return df
+
+def load_data():
+    # Every result source is read exactly once and shared by all figures.
+    store = get_store()
+    return {
+        "records": _typed(store.load_records()),
+        "meet": _typed(store.load_meet()),
+        "selected": _typed(store.load_selected()),
+        "baseline": _typed(store.load_baseline())
+    }
+
+def _final_round(data):
+    rounds = data["records"]["round"].dropna()
+    return int(rounds.max()) if not rounds.empty else None
+
+def plot_round(data, round_idx):
+    f = f"round_{round_idx}_results.json"
+    df = data["records"]
+    df = df[df["round"] == round_idx].copy()
+    if df.empty or "rouge1" not in df.columns or "parent_name" not in df.columns:
         return
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()]
-    df = pd.DataFrame(records)
-    if "meet_round" not in df: 
+    df["mutation_short"] = df["mutation"].apply(shorten_mutation)
+    plt.figure(figsize=(10,6))
+    sns.barplot(data=df, x="parent_name", y="rouge1", hue="mutation_short", errorbar=None)
+    plt.xticks(rotation=0)
+    plt.title(f"{f} — rouge1 by prompt & mutation (mean)")
+    plt.savefig(os.path.join(PIC_DIR, f.replace(".json","_bar.png")))
+    plt.close()
+
+def plot_rounds(data):
+    for round_idx in sorted(data["records"]["round"].dropna().unique()):
+        plot_round(data, int(round_idx))
+
+def plot_threshold_trend(data):
+    df = data["meet"].copy()
+    if df.empty or "meet_round" not in df: 
         return
     trend = df.groupby("meet_round").size().reset_index(name="count")
     plt.figure(figsize=(8,5))
@@ -65,12 +94,8 @@ def plot_threshold_trend():
     plt.savefig(os.path.join(PIC_DIR,"threshold_trend.png"))
     plt.close()
 
-def plot_threshold_stats():
-    path = os.path.join(RESULT_DIR,"meet_threshold.json")
-    if not os.path.exists(path):
-        return
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()]
-    df = pd.DataFrame(records)
+def plot_threshold_stats(data):
+    df = data["meet"].copy()
     if df.empty or "parent_name" not in df.columns: 
         return
     df["mutation_short"] = df["mutation"].apply(shorten_mutation)
@@ -85,12 +110,8 @@ def plot_threshold_stats():
     plt.savefig(os.path.join(PIC_DIR,"threshold_mutations.png"))
     plt.close()
 
-def plot_topk_stats():
-    path = os.path.join(RESULT_DIR,"selected_topk.json")
-    if not os.path.exists(path):
-        return
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()]
-    df = pd.DataFrame(records)
+def plot_topk_stats(data):
+    df = data["selected"].copy()
     if df.empty or "parent_name" not in df.columns: 
         return
     df["mutation_short"] = df["mutation"].apply(shorten_mutation)
@@ -105,12 +126,8 @@ def plot_topk_stats():
     plt.savefig(os.path.join(PIC_DIR,"topk_mutations.png"))
     plt.close()
 
-def plot_rouge_vs_compression():
-    path = os.path.join(RESULT_DIR, "meet_threshold.json")
-    if not os.path.exists(path):
-        return
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()]
-    df = pd.DataFrame(records)
+def plot_rouge_vs_compression(data):
+    df = data["meet"].copy()
     if df.empty or "rouge1" not in df.columns or "parent_name" not in df.columns:
         return
     plt.figure(figsize=(8,6))
@@ -121,12 +138,8 @@ def plot_rouge_vs_compression():
     plt.savefig(os.path.join(PIC_DIR, "rouge_vs_compression.png"), dpi=300)
     plt.close()
 
-def plot_rouge_vs_compression_trend():
-    path = os.path.join(RESULT_DIR, "meet_threshold.json")
-    if not os.path.exists(path):
-        return
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()]
-    df = pd.DataFrame(records)
+def plot_rouge_vs_compression_trend(data):
+    df = data["meet"].copy()
     if df.empty or "rouge1" not in df.columns or "parent_name" not in df.columns:
         return
     sns.lmplot(data=df, x="compression", y="rouge1", hue="parent_name", aspect=1.2, height=6, scatter_kws={"s":40}, ci=None)
@@ -136,12 +149,8 @@ def plot_rouge_vs_compression_trend():
     plt.savefig(os.path.join(PIC_DIR, "rouge_vs_compression_trend.png"))
     plt.close()
 
-def plot_score_distributions():
-    path = os.path.join(RESULT_DIR, "meet_threshold.json")
-    if not os.path.exists(path):
-        return
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()]
-    df = pd.DataFrame(records)
+def plot_score_distributions(data):
+    df = data["meet"].copy()
     if df.empty or "rouge1" not in df.columns:
         return
     df["fre"] = df["fre"] / 100.0
@@ -153,24 +162,16 @@ def plot_score_distributions():
     plt.savefig(os.path.join(PIC_DIR, "score_distributions.png"), dpi=300)
     plt.close()
 
-def plot_metric_relationships(): 
-    path = os.path.join(RESULT_DIR, "meet_threshold.json") 
-    if not os.path.exists(path): 
-        return 
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()] 
-    df = pd.DataFrame(records) 
+def plot_metric_relationships(data):
+    df = data["meet"].copy()
     if df.empty or "rouge1" not in df.columns or "parent_name" not in df.columns: 
         return 
     sns.pairplot(df, vars=["rouge1", "rougel", "fre", "compression"], hue="parent_name") 
     plt.savefig(os.path.join(PIC_DIR, "metric_relationships.png")) 
     plt.close()
 
-def plot_prompt_radar():
-    path = os.path.join(RESULT_DIR, "meet_threshold.json")
-    if not os.path.exists(path):
-        return
-    records = [json.loads(line) for line in open(path,"r",encoding="utf-8") if line.strip()]
-    df = pd.DataFrame(records)
+def plot_prompt_radar(data):
+    df = data["meet"].copy()
     if df.empty or "rouge1" not in df.columns or "parent_name" not in df.columns:
         return
     agg = df.groupby("parent_name").agg({"rouge1":"mean","rougel":"mean","fre":"mean","compression":"mean"}).reset_index()
@@ -194,11 +195,11 @@ def plot_prompt_radar():
     plt.savefig(os.path.join(PIC_DIR,"prompt_radar.png"), dpi=180)
     plt.close()
 
-def plot_dataset_bar():
-    path = os.path.join(RESULT_DIR, "round_5_results.json")
-    if not os.path.exists(path):
+def plot_dataset_bar(data):
+    final_round = _final_round(data)
+    if final_round is None:
         return
-    df = load_and_flatten(path)
+    df = data["records"][data["records"]["round"] == final_round]
     if df.empty or "rouge1" not in df.columns:
         return
     summary = df.groupby("dataset")[["rouge1", "rougel", "fre"]].mean().round(3)
@@ -217,24 +218,18 @@ def plot_dataset_bar():
     plt.savefig(os.path.join(PIC_DIR, "dataset_bar.png"), dpi=300)
     plt.close() 
 
-def plot_baseline_vs_final():
-    baseline_path=os.path.join(RESULT_DIR,"baseline.json")
-    final_path=os.path.join(RESULT_DIR,"round_5_results.json")
-    meet_path=os.path.join(RESULT_DIR,"meet_threshold.json")
-    if not os.path.exists(baseline_path):
-        return
-    final_data=[]
-    if os.path.exists(final_path):
-        final_data.extend(json.load(open(final_path,"r",encoding="utf-8")))
-    if os.path.exists(meet_path):
-        for line in open(meet_path,"r",encoding="utf-8"):
-            if line.strip():
-                final_data.append(json.loads(line))
-    if not final_data:
+def plot_baseline_vs_final(data):
+    df_base=data["baseline"]
+    final_round=_final_round(data)
+    frames=[]
+    if final_round is not None:
+        frames.append(data["records"][data["records"]["round"] == final_round])
+    frames.append(data["meet"])
+    frames=[f for f in frames if not f.empty]
+    if df_base.empty or not frames:
         return
-    df_base=load_and_flatten(baseline_path)
-    df_final=pd.DataFrame(final_data)
-    if df_base.empty or df_final.empty or "rouge1" not in df_final.columns:
+    df_final=pd.concat(frames,ignore_index=True)
+    if "rouge1" not in df_final.columns:
         return
     base_avg=df_base[["rouge1","rougel","fre"]].mean().round(3)
     final_avg=df_final[["rouge1","rougel","fre"]].mean().round(3)
@@ -248,15 +243,140 @@ def plot_baseline_vs_final():
     plt.savefig(os.path.join(PIC_DIR,"baseline_vs_final.png"),dpi=300)
     plt.close()
 
+# Slowest first (pairplot dominates), so the pool does not end on one long task.
+FIGURES = [
+    plot_metric_relationships,
+    plot_threshold_trend,
+    plot_threshold_stats,
+    plot_topk_stats,
+    plot_rouge_vs_compression,
+    plot_rouge_vs_compression_trend,
+    plot_score_distributions,
+    plot_prompt_radar,
+    plot_dataset_bar,
+    plot_baseline_vs_final
+]
+
+FIGURE_INPUTS = {
+    plot_metric_relationships: ["meet"],
+    plot_threshold_trend: ["meet"],
+    plot_threshold_stats: ["meet"],
+    plot_topk_stats: ["selected"],
+    plot_rouge_vs_compression: ["meet"],
+    plot_rouge_vs_compression_trend: ["meet"],
+    plot_score_distributions: ["meet"],
+    plot_prompt_radar: ["meet"],
+    plot_dataset_bar: ["final_round"],
+    plot_baseline_vs_final: ["baseline", "final_round", "meet"]
+}
+
+FIGURE_OUTPUTS = {
+    plot_metric_relationships: ["metric_relationships.png"],
+    plot_threshold_trend: ["threshold_trend.png"],
+    plot_threshold_stats: ["threshold_prompts.png", "threshold_mutations.png"],
+    plot_topk_stats: ["topk_prompts.png", "topk_mutations.png"],
+    plot_rouge_vs_compression: ["rouge_vs_compression.png"],
+    plot_rouge_vs_compression_trend: ["rouge_vs_compression_trend.png"],
+    plot_score_distributions: ["score_distributions.png"],
+    plot_prompt_radar: ["prompt_radar.png"],
+    plot_dataset_bar: ["dataset_bar.png"],
+    plot_baseline_vs_final: ["baseline_vs_final.png"]
+}
+
+def figure_tasks(data):
+    # (name, fn, args); names are what --only accepts.
+    tasks = [(fn.__name__[len("plot_"):], fn, ()) for fn in FIGURES]
+    tasks += [(f"round_{int(r)}", plot_round, (int(r),)) for r in sorted(data["records"]["round"].dropna().unique())]
+    return tasks
+
+def _frame_hash(df):
+    h = hashlib.sha256()
+    h.update(",".join(map(str, df.columns)).encode("utf-8"))
+    if not df.empty:
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+def figure_fingerprint(data, fn, args):
+    # Content hash of exactly the rows a figure plots, plus its plotting code and arguments.
+    records = data["records"]
+    if fn is plot_round:
+        frames = [records[records["round"] == args[0]]]
+    else:
+        final_round = _final_round(data)
+        frames = []
+        for source in FIGURE_INPUTS[fn]:
+            if source == "final_round":
+                frames.append(records[records["round"] == final_round] if final_round is not None else records.iloc[0:0])
+            else:
+                frames.append(data[source])
+    inputs = hashlib.sha256("".join(_frame_hash(df) for df in frames).encode("utf-8")).hexdigest()
+    params = hashlib.sha256((inspect.getsource(fn) + repr(args)).encode("utf-8")).hexdigest()
+    return {"inputs": inputs, "params": params}
+
+def figure_outputs(fn, args):
+    if fn is plot_round:
+        return [f"round_{args[0]}_results_bar.png"]
+    return FIGURE_OUTPUTS[fn]
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+
+_worker_data = None
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+def _render(task):
+    fn, args = task
+    fn(_worker_data, *args)
+    return fn.__name__
+
+def render_all(data=None, workers=1, force=False, only=None):
+    data = load_data() if data is None else data
+    manifest = load_manifest()
+    tasks = []
+    for name, fn, args in figure_tasks(data):
+        if only and name not in only:
+            continue
+        fingerprint = figure_fingerprint(data, fn, args)
+        outputs = figure_outputs(fn, args)
+        entry = manifest.get(name)
+        fresh = (entry is not None and entry.get("inputs") == fingerprint["inputs"]
+                 and entry.get("params") == fingerprint["params"]
+                 and all(os.path.exists(os.path.join(PIC_DIR, o)) for o in outputs))
+        if force or not fresh:
+            tasks.append((name, fn, args, dict(fingerprint, outputs=outputs)))
+    print(f"[charts] {len(tasks)} figure(s) to render")
+    if not tasks:
+        return
+
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        for name, fn, args, entry in tasks:
+            fn(data, *args)
+            manifest[name] = entry
+    else:
+        # Figures are independent; the shared data is shipped to each worker once.
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+            for (name, _, _, entry), _ in zip(tasks, pool.map(_render, [(fn, args) for _, fn, args, _ in tasks])):
+                manifest[name] = entry
+    save_manifest(manifest)
+
 if __name__ == "__main__":
-    plot_rounds()
-    plot_threshold_trend()
-    plot_threshold_stats()
-    plot_topk_stats()
-    plot_rouge_vs_compression()
-    plot_rouge_vs_compression_trend()
-    plot_score_distributions()
-    plot_metric_relationships()
-    plot_prompt_radar()
-    plot_dataset_bar()
-    plot_baseline_vs_final()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of rendering processes")
+    parser.add_argument("--force", action="store_true", help="re-render every figure")
+    parser.add_argument("--only", action="append", metavar="FIGURE",
+                        help="render only this figure (e.g. prompt_radar, round_3); repeatable")
+    args = parser.parse_args()
+    render_all(workers=args.workers, force=args.force, only=args.only)
@@ -0,0 +1,364 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+UNIT_SIZE = 64
+LEASE_SECONDS = float(os.environ.get("WORK_LEASE_SECONDS", 120))
+POLL_SECONDS = 1.0
+GUARD_STALE_SECONDS = 10.0
+
+# Shared-directory layout, one directory per job (a round, or a racing stage of one):
+#   <root>/<job>/job.json             settings the workers must match
+#   <root>/<job>/units/NNNNN.json     self-contained cells (prompt, input text, reference, article)
+#   <root>/<job>/leases/NNNNN.lease   {"worker", "expires"}; written to a temp name and hard-linked in
+#   <root>/<job>/leases/NNNNN.lease.guard  held while a lease is checked and changed
+#   <root>/<job>/done/NNNNN.jsonl     scored records, written to a temp name and renamed
+#   <root>/<job>/done/NNNNN.err       traceback of a unit that failed; the coordinator re-raises it
+# Every write that other hosts read is a rename, so readers never see partial files.
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp-{uuid.uuid4().hex}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def job_settings():
+    import llm_utils
+    return json.loads(json.dumps({"model": llm_utils.MODEL_NAME, "backend": llm_utils.backends.BACKEND,
+                                  "decode": llm_utils.decode_params(128),
+                                  "generation_params": llm_utils.GENERATION_PARAMS}))
+
+class Lease:
+    # A lease is created by hard-linking a fully written temp file to its name, which fails if
+    # the lease already exists, so no one ever sees an empty lease. Every change to an existing
+    # lease (reclaiming it, renewing it, releasing it) checks the owner and writes under a
+    # short-lived guard file, so a renewal cannot overwrite a reclaimer's lease and a release
+    # cannot delete one.
+    def __init__(self, path, worker_id, seconds=LEASE_SECONDS):
+        self.path = path
+        self.guard_path = path + ".guard"
+        self.worker_id = worker_id
+        self.seconds = seconds
+
+    def _payload(self):
+        return json.dumps({"worker": self.worker_id, "expires": time.time() + self.seconds})
+
+    @contextlib.contextmanager
+    def _guard(self):
+        while True:
+            try:
+                os.close(os.open(self.guard_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                # A guard is held for milliseconds; an old one was left by a crashed worker.
+                try:
+                    if time.time() - os.path.getmtime(self.guard_path) > GUARD_STALE_SECONDS:
+                        os.remove(self.guard_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(self.guard_path)
+            except FileNotFoundError:
+                pass
+
+    def _owner(self):
+        try:
+            return _read_json(self.path)
+        except (OSError, ValueError):
+            return None
+
+    def _create(self):
+        tmp = f"{self.path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self._payload())
+        try:
+            os.link(tmp, self.path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+
+    def claim(self):
+        if self._create():
+            return True
+        return self._reclaim_expired() and self._create()
+
+    def _reclaim_expired(self):
+        with self._guard():
+            lease = self._owner()
+            if lease is None:
+                # Unreadable, e.g. left empty by a worker that crashed under an older version:
+                # expired once it is older than a lease.
+                try:
+                    if time.time() - os.path.getmtime(self.path) <= self.seconds:
+                        return False
+                except FileNotFoundError:
+                    return True
+                lease = {"worker": "unknown"}
+            elif lease["expires"] > time.time():
+                return False
+            os.remove(self.path)
+        print(f"[worker {self.worker_id}] reclaimed {os.path.basename(self.path)} from {lease['worker']}")
+        return True
+
+    def renew(self):
+        try:
+            with self._guard():
+                lease = self._owner()
+                if lease is None or lease["worker"] != self.worker_id:
+                    return False
+                _write_atomic(self.path, self._payload())
+        except FileNotFoundError:
+            return False  # job finished and removed
+        return True
+
+    def release(self):
+        try:
+            with self._guard():
+                lease = self._owner()
+                if lease is not None and lease["worker"] == self.worker_id:
+                    os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class Heartbeat:
+    def __init__(self, lease):
+        self.lease = lease
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease.seconds / 3):
+            if not self.lease.renew():
+                # Someone reclaimed it; results are deterministic, so finishing is harmless.
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+def _local_worker_args():
+    # Local workers must generate exactly like the coordinator would.
+    import assisted
+    import backends
+    args = ["--backend", backends.BACKEND]
+    if assisted.DRAFT_MODEL:
+        args += ["--assist", assisted.DRAFT_MODEL, "--assist-lookahead", str(assisted.LOOKAHEAD)]
+    return args
+
+def _unit_name(i):
+    return f"{i:05d}"
+
+class Coordinator:
+    # Splits a list of cells into units on the shared directory, optionally starts local
+    # worker processes, and yields scored results as units complete.
+    def __init__(self, root, local_workers=0, unit_size=UNIT_SIZE):
+        self.root = root
+        self.local_workers = local_workers
+        self.unit_size = unit_size
+        self._procs = []
+
+    def __enter__(self):
+        os.makedirs(self.root, exist_ok=True)
+        for n in range(self.local_workers):
+            cmd = [sys.executable, os.path.abspath(__file__), "worker", "--queue", self.root,
+                   "--worker-id", f"{socket.gethostname()}-local{n}"] + _local_worker_args()
+            self._procs.append(subprocess.Popen(cmd))
+        return self
+
+    def __exit__(self, *exc):
+        for p in self._procs:
+            p.terminate()
+        for p in self._procs:
+            p.wait()
+        self._procs = []
+        return False
+
+    def _create_job(self, name, items):
+        # items: list of (index, prompt, text, reference, article); text is what the prompt is
+        # applied to and differs from the scored article in long-document mode. The job name hashes
+        # its content, so a restarted coordinator picks up the units already done.
+        digest = hashlib.sha256(json.dumps([name, items], ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+        job_dir = os.path.join(self.root, f"{name}-{digest}")
+        if os.path.exists(os.path.join(job_dir, "job.json")):
+            return job_dir
+        tmp = f"{job_dir}.tmp-{uuid.uuid4().hex}"
+        for sub in ["units", "leases", "done"]:
+            os.makedirs(os.path.join(tmp, sub))
+        n_units = 0
+        for start in range(0, len(items), self.unit_size):
+            chunk = items[start:start + self.unit_size]
+            sources = list(dict.fromkeys((t, r, None if a == t else a) for _, _, t, r, a in chunk))
+            src_idx = {src: k for k, src in enumerate(sources)}
+            unit = {"articles": sources,
+                    "cells": [[i, p, src_idx[(t, r, None if a == t else a)]] for i, p, t, r, a in chunk]}
+            with open(os.path.join(tmp, "units", _unit_name(n_units) + ".json"), "w", encoding="utf-8") as f:
+                json.dump(unit, f, ensure_ascii=False)
+            n_units += 1
+        with open(os.path.join(tmp, "job.json"), "w", encoding="utf-8") as f:
+            json.dump({"name": name, "units": n_units, "items": len(items), "settings": job_settings()}, f)
+        try:
+            os.rename(tmp, job_dir)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return job_dir
+
+    def run(self, name, items):
+        # Yields (index, summary, scores) per item, unit by unit as workers finish them.
+        job_dir = self._create_job(name, items)
+        n_units = _read_json(os.path.join(job_dir, "job.json"))["units"]
+        print(f"[coordinator] {name}: {len(items)} cells in {n_units} units under {job_dir}")
+        merged = set()
+        last_report = time.time()
+        while len(merged) < n_units:
+            for unit in range(n_units):
+                if unit in merged:
+                    continue
+                path = os.path.join(job_dir, "done", _unit_name(unit) + ".jsonl")
+                err_path = os.path.join(job_dir, "done", _unit_name(unit) + ".err")
+                if os.path.exists(err_path):
+                    with open(err_path, "r", encoding="utf-8") as f:
+                        error = f.read()
+                    # Removed so that a restarted coordinator retries the unit.
+                    os.remove(err_path)
+                    raise RuntimeError(f"Work unit {_unit_name(unit)} of {name} failed:\n{error}")
+                if not os.path.exists(path):
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        i, summary, scores = json.loads(line)
+                        yield i, summary, scores
+                merged.add(unit)
+            if len(merged) < n_units:
+                if self._procs and all(p.poll() is not None for p in self._procs):
+                    codes = [p.returncode for p in self._procs]
+                    raise RuntimeError(f"All local workers exited (codes {codes}) with "
+                                       f"{n_units - len(merged)} units of {name} left")
+                if time.time() - last_report >= 10:
+                    leases = [f for f in os.listdir(os.path.join(job_dir, "leases")) if f.endswith(".lease")]
+                    print(f"[coordinator] {name}: {len(merged)}/{n_units} units merged, {len(leases)} leased")
+                    last_report = time.time()
+                time.sleep(POLL_SECONDS)
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+def _process_unit(unit_path):
+    from llm_utils import iter_summarize
+    from evaluation import evaluate_summary
+    unit = _read_json(unit_path)
+    articles = unit["articles"]
+    pairs = [(prompt, articles[a][0]) for _, prompt, a in unit["cells"]]
+    lines = [None] * len(pairs)
+    for k, summary in iter_summarize(pairs):
+        i, _, a = unit["cells"][k]
+        text, reference, article = articles[a]
+        lines[k] = json.dumps([i, summary, evaluate_summary(summary, reference, article or text)], ensure_ascii=False)
+    return "".join(line + "\n" for line in lines)
+
+def _open_jobs(root):
+    try:
+        names = sorted(os.listdir(root))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(root, n) for n in names if ".tmp-" not in n and os.path.exists(os.path.join(root, n, "job.json"))]
+
+def work_once(root, worker_id, settings, lease_seconds=LEASE_SECONDS):
+    # Claims and completes at most one unit; returns True if it did.
+    for job_dir in _open_jobs(root):
+        try:
+            job = _read_json(os.path.join(job_dir, "job.json"))
+        except (OSError, ValueError):
+            continue
+        if job["settings"] != settings:
+            print(f"[worker {worker_id}] skipping {os.path.basename(job_dir)}: it needs {job['settings']}")
+            continue
+        # Start at a worker-specific unit so workers do not all contend for unit 0.
+        offset = int(hashlib.sha256(worker_id.encode()).hexdigest(), 16) % max(1, job["units"])
+        for n in range(job["units"]):
+            unit = _unit_name((offset + n) % job["units"])
+            done_path = os.path.join(job_dir, "done", unit + ".jsonl")
+            err_path = os.path.join(job_dir, "done", unit + ".err")
+            if os.path.exists(done_path) or os.path.exists(err_path):
+                continue
+            lease = Lease(os.path.join(job_dir, "leases", unit + ".lease"), worker_id, lease_seconds)
+            try:
+                if not lease.claim():
+                    continue
+            except FileNotFoundError:
+                break  # job finished and removed meanwhile
+            try:
+                with Heartbeat(lease):
+                    text = _process_unit(os.path.join(job_dir, "units", unit + ".json"))
+                _write_atomic(done_path, text)
+            except FileNotFoundError:
+                break
+            except Exception:
+                # Recorded for the coordinator instead of killing this worker and then the next one.
+                print(f"[worker {worker_id}] unit {unit} of {os.path.basename(job_dir)} failed")
+                try:
+                    _write_atomic(err_path, traceback.format_exc())
+                except FileNotFoundError:
+                    break
+            finally:
+                lease.release()
+            return True
+    return False
+
+def run_worker(root, worker_id, exit_when_idle=None, lease_seconds=LEASE_SECONDS):
+    settings = job_settings()
+    print(f"[worker {worker_id}] polling {root}")
+    done = 0
+    idle_since = time.time()
+    while True:
+        if work_once(root, worker_id, settings, lease_seconds):
+            done += 1
+            idle_since = time.time()
+            continue
+        if exit_when_idle is not None and time.time() - idle_since >= exit_when_idle:
+            print(f"[worker {worker_id}] idle, exiting after {done} units")
+            return done
+        time.sleep(POLL_SECONDS)
+
+if __name__ == "__main__":
+    import assisted
+    import backends
+    from quality_gate import select_backend
+    parser = argparse.ArgumentParser(description="Distributed round execution over a shared directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("worker", help="claim and process work units until stopped")
+    p.add_argument("--queue", required=True, help="shared work directory")
+    p.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    p.add_argument("--exit-when-idle", type=float, default=None, metavar="SECONDS")
+    p.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    p.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND)
+    p.add_argument("--assist", nargs="?", const=assisted.DEFAULT_DRAFT_MODEL, default=assisted.DRAFT_MODEL,
+                   metavar="DRAFT_MODEL")
+    p.add_argument("--assist-lookahead", type=int, default=assisted.LOOKAHEAD)
+    args = parser.parse_args()
+    select_backend(args.backend)
+    assisted.configure(args.assist, args.assist_lookahead)
+    run_worker(args.queue, args.worker_id, args.exit_when_idle, args.lease_seconds)